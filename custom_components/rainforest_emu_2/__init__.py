@@ -3,11 +3,14 @@ from __future__ import annotations
 
 import asyncio
 import datetime
+import functools
 import logging
+import time
 from typing import Callable
 
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.event import async_track_time_interval
 from homeassistant.util import dt
 from homeassistant.const import (
     Platform,
@@ -20,22 +23,83 @@ from homeassistant.const import (
     CONF_PORT
 )
 
-from .emu2 import Emu2
+from .emu2 import Emu2, STATE_STREAMING, STATE_STALLED, STATE_CLOSED, STATE_OPENING
+from .emu2_history import ReadingHistory
+from .emu2_hub import Emu2Hub
+from .emu2_journal import Journal
 from .const import (
     DOMAIN, 
     DEVICE_ID,
     DEVICE_NAME,
     ATTR_DEVICE_PATH,
-    ATTR_DEVICE_MAC_ID
+    ATTR_DEVICE_MAC_ID,
+    ATTR_PRIMARY_METER_MAC,
+    CONF_FAST_POLL_FREQUENCY,
+    DEFAULT_FAST_POLL_FREQUENCY,
+    CONF_PROFILE_BACKFILL,
+    DEFAULT_PROFILE_BACKFILL,
+    CONF_JOURNAL,
+    DEFAULT_JOURNAL,
+    CONF_METRICS,
+    DEFAULT_METRICS,
+    CONF_DECODE_SUBSCRIBED_ONLY,
+    DEFAULT_DECODE_SUBSCRIBED_ONLY,
+    DATA_HUB
 )
 
 _LOGGER = logging.getLogger(__name__)
 
-PLATFORMS: list[str] = [Platform.SENSOR]
+PLATFORMS: list[str] = [Platform.SENSOR, Platform.SWITCH]
+
+# Seconds between the PriceCluster notifications requested from the device
+PRICE_SCHEDULE_INTERVAL = 60
+
+# Readings are pushed by the device. When nothing has arrived for a meter
+# within the window, in seconds, the command is sent to ask for it.
+FALLBACK_POLLS = {
+    'PriceCluster': ('get_current_price', 3 * PRICE_SCHEDULE_INTERVAL),
+    # The device has no schedule event for the period usage
+    'CurrentPeriodUsage': ('get_current_period_usage', 60),
+}
+FALLBACK_CHECK_INTERVAL = datetime.timedelta(seconds = 30)
+
+# Notifications with the readings of a meter. The primary meter is the
+# first one these arrive for.
+METERING_TYPES = frozenset((
+    'InstantaneousDemand',
+    'CurrentSummationDelivered',
+    'CurrentPeriodUsage',
+    'PriceCluster',
+))
+
+# Notifications used by the device itself, which are always decoded
+DEVICE_TYPES = METERING_TYPES | {'MeterList'}
+
+# Minutes the device stays in fast poll mode, which is renewed a minute
+# before it runs out. The device allows at most 15 minutes.
+FAST_POLL_DURATION = 15
+
+# Seconds between imports of the meter interval data, and of the journal
+PROFILE_BACKFILL_INTERVAL = 3600
+
+# Readings are journaled in a batch this often
+JOURNAL_FLUSH_INTERVAL = datetime.timedelta(seconds = 10)
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up Rainforest EMU-2 from a config entry."""
-    emu2device = RainforestEmu2Device(hass, entry.data)
+    # Every device shares one hub, which limits how many connections open
+    # at once and keeps one busy device from holding up the others
+    hub = hass.data.get(DATA_HUB)
+    if hub is None:
+        hub = hass.data[DATA_HUB] = Emu2Hub()
+
+    emu2device = RainforestEmu2Device(hass, entry.data, entry.options, hub)
+
+    @callback
+    def save_primary_meter(meter_mac):
+        hass.config_entries.async_update_entry(entry, data = {**entry.data, ATTR_PRIMARY_METER_MAC: meter_mac})
+
+    emu2device.register_primary_meter_listener(save_primary_meter)
 
     async def async_shutdown(event):
         # Handle shutdown
@@ -45,8 +109,18 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     hass.data.setdefault(DOMAIN, {})[entry.entry_id] = emu2device
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
 
+    entry.async_on_unload(entry.add_update_listener(async_reload_entry))
+
     return True
 
+async def async_reload_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Reload a config entry when its options change."""
+    # Saving the primary meter only changes the data
+    emu2device = hass.data.get(DOMAIN, {}).get(entry.entry_id)
+    if emu2device is not None and dict(emu2device.options) == dict(entry.options):
+        return
+    await hass.config_entries.async_reload(entry.entry_id)
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
     unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
@@ -59,70 +133,543 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
 
     return unload_ok    
 
+# A registered callback. When changed lists response attributes, the
+# callback is only made when one of them differs from the last call.
+class Emu2Subscription:
+    __slots__ = ("callback", "changed", "last")
+
+    def __init__(self, callback, changed):
+        self.callback = callback
+        self.changed = changed
+        self.last = None
+
+# Readings which are kept in a history for each meter
+HISTORY_VALUES = ('power', 'summation_delivered', 'summation_received', 'current_price', 'current_usage')
+
+# Latest readings from a single meter, and the recent history of each
+class Emu2MeterState:
+    def __init__(self, meter_mac: str):
+        self.meter_mac = meter_mac
+        self.power = None
+        self.summation_delivered = None
+        self.summation_received = None
+        self.current_price = None
+        self.current_usage = None
+        self.current_usage_start_date = dt.utc_from_timestamp(0)
+        # Converts the raw summation, and interval data, to kWh
+        self.summation_scale = None
+        self.history = {name: ReadingHistory() for name in HISTORY_VALUES}
+
+    def _record(self, name, value, now) -> None:
+        setattr(self, name, value)
+        if value is not None:
+            self.history[name].append(now, value)
+
 class RainforestEmu2Device:
     def __init__(
         self,
         hass : HomeAssistant,
-        properties
+        properties,
+        options = None,
+        hub = None
     ):
         self._hass = hass
         self._properties = properties
-        self._callbacks = set()
-
-        self._power = None
-       
-        self._summation_delivered = None
-        self._summation_received = None
-        self._current_price = None
-        self._current_usage = None
-        self._current_usage_start_date = dt.utc_from_timestamp(0)
+        self._options = options or {}
+
+        # Lists of subscriptions keyed by (type, meter mac). A meter mac of
+        # None follows the primary meter, which is the first one readings
+        # were ever received for. It is saved in the entry data once chosen.
+        self._callbacks = {}
+        self._meters = {}
+        self._primary_meter = properties.get(ATTR_PRIMARY_METER_MAC)
+        self._meter_listeners = []
+        self._primary_meter_listeners = []
+
+        # Called when the connection comes up or drops, so entities can
+        # update their availability
+        self._connection_listeners = []
+
+        # Write policies of the sensors, keyed by (sensor key, meter mac),
+        # kept for their counters
+        self._write_policies = {}
   
         self._emu2 = Emu2(properties.get(ATTR_DEVICE_PATH, ""), properties.get(CONF_HOST, ""), properties.get(CONF_PORT, 0))        
         self._emu2.register_process_callback(self._process_update)
-
-        self._serial_loop_task = self._hass.loop.create_task(self._emu2.serial_read())
+        self._emu2.use_hub(hub)
+        if self._options.get(CONF_METRICS, DEFAULT_METRICS):
+            self._emu2.enable_metrics()
+
+        # When enabled, notifications nobody uses are dropped before they
+        # are decoded. The set is updated in place as callbacks come and go.
+        self._decode_types = None
+        if self._options.get(CONF_DECODE_SUBSCRIBED_ONLY, DEFAULT_DECODE_SUBSCRIBED_ONLY):
+            self._decode_types = set(DEVICE_TYPES)
+            self._emu2.set_decode_filter(self._decode_types)
+
+        # Time each reading was last received, keyed by (type, meter mac)
+        self._last_update = {}
+
+        # High resolution demand, demand notifications which arrive more
+        # than half an interval late are counted, as are the number of
+        # notifications missing from the gap. Only gaps between readings
+        # which both arrived after fast poll was sent on this connection,
+        # at _fast_poll_since, are counted.
+        self._fast_poll_task = None
+        self._fast_poll_since = None
+        self._fast_poll_frequency = self._options.get(CONF_FAST_POLL_FREQUENCY, DEFAULT_FAST_POLL_FREQUENCY)
+        self._fast_poll_late = 0
+        self._fast_poll_dropped = 0
+
+        self._backfill_task = None
+        if self._options.get(CONF_PROFILE_BACKFILL, DEFAULT_PROFILE_BACKFILL):
+            self._backfill_task = hass.loop.create_task(self._backfill_profile())
+
+        # Readings are added to the journal as they arrive, and written out
+        # in the executor every JOURNAL_FLUSH_INTERVAL. It is opened before
+        # the connection, see _run_connection.
+        self._journal = None
+        self._journal_task = None
+        self._journal_write = None
+        self._cancel_journal_flush = None
+        if self._options.get(CONF_JOURNAL, DEFAULT_JOURNAL):
+            self._journal = Journal(hass.config.path(DOMAIN, properties[ATTR_DEVICE_MAC_ID]))
+
+        self._serial_loop_task = self._hass.loop.create_task(self._run_connection())
+        self._schedule_task = self._hass.loop.create_task(self._configure_schedule())
+        self._connection_task = self._hass.loop.create_task(self._watch_connection())
+        self._cancel_fallback = async_track_time_interval(
+            self._hass, self._async_poll_stale, FALLBACK_CHECK_INTERVAL
+        )
 
     async def stop(self):
-        self._serial_loop_task.cancel()
+        if self._cancel_fallback is not None:
+            self._cancel_fallback()
+            self._cancel_fallback = None
 
-        try:
-            await self._serial_loop_task
-        except asyncio.CancelledError as ex:
-            pass
+        for task in (self._fast_poll_task, self._backfill_task, self._journal_task):
+            if task is not None:
+                task.cancel()
+
+        for task in (self._schedule_task, self._connection_task, self._serial_loop_task):
+            task.cancel()
+
+            try:
+                await task
+            except asyncio.CancelledError as ex:
+                pass
 
         await self._emu2.close()
+        self._emu2.use_hub(None)
 
-    def register_callback(self, type: str, callback: Callable[[], None]) -> None:
-        """Register callback, called when serial data received."""
-        self._callbacks.add((type, callback))
+        if self._journal is not None:
+            await self._async_close_journal()
 
-    def remove_callback(self, type: str, callback: Callable[[], None]) -> None:
+    def register_callback(
+        self,
+        type: str,
+        callback: Callable[[], None],
+        meter_mac: str = None,
+        changed: tuple[str, ...] = None
+    ) -> Callable[[], None]:
+        """Register callback, called when serial data received.
+
+        When changed names attributes of the response, the callback is
+        skipped unless one of them has changed. Returns a function that
+        removes the callback.
+        """
+        key = (type, meter_mac)
+        subscription = Emu2Subscription(callback, changed)
+        self._callbacks.setdefault(key, []).append(subscription)
+        self._update_decode_types()
+
+        def unsubscribe() -> None:
+            subscriptions = self._callbacks.get(key)
+            if subscriptions is not None and subscription in subscriptions:
+                subscriptions.remove(subscription)
+                if not subscriptions:
+                    del self._callbacks[key]
+                    self._update_decode_types()
+
+        return unsubscribe
+
+    def remove_callback(self, type: str, callback: Callable[[], None], meter_mac: str = None) -> None:
         """Remove previously registered callback."""
-        self._callbacks.discard((type, callback))
+        key = (type, meter_mac)
+        subscriptions = self._callbacks.get(key)
+        if subscriptions is None:
+            return
+
+        subscriptions[:] = [s for s in subscriptions if s.callback != callback]
+        if not subscriptions:
+            del self._callbacks[key]
+            self._update_decode_types()
+
+    def _update_decode_types(self) -> None:
+        if self._decode_types is None:
+            return
+        types = DEVICE_TYPES.union(type for type, _ in self._callbacks)
+        if types != self._decode_types:
+            self._decode_types.clear()
+            self._decode_types.update(types)
+
+    def register_connection_listener(self, listener: Callable[[], None]) -> Callable[[], None]:
+        """Register listener, called when the device connects or disconnects. Returns a function that removes it."""
+        self._connection_listeners.append(listener)
+
+        def unsubscribe() -> None:
+            if listener in self._connection_listeners:
+                self._connection_listeners.remove(listener)
+
+        return unsubscribe
+
+    async def _watch_connection(self):
+        while True:
+            await self._emu2.wait_for_state(STATE_STREAMING, STATE_STALLED)
+            self._notify_connection()
+            await self._emu2.wait_for_state(STATE_CLOSED, STATE_OPENING)
+            self._notify_connection()
+
+    def _notify_connection(self) -> None:
+        # Copied, as a listener may unsubscribe
+        for listener in tuple(self._connection_listeners):
+            listener()
+
+    def register_write_policy(self, key: str, meter_mac: str, policy) -> Callable[[], None]:
+        """Register the write policy of a sensor. Returns a function that removes it."""
+        self._write_policies[(key, meter_mac)] = policy
+
+        def unregister() -> None:
+            if self._write_policies.get((key, meter_mac)) is policy:
+                del self._write_policies[(key, meter_mac)]
+
+        return unregister
+
+    @property
+    def write_policies(self) -> dict:
+        return dict(self._write_policies)
+
+    def register_meter_listener(self, listener: Callable[[str], None]) -> None:
+        """Register listener, called with the mac of each meter after the primary one."""
+        self._meter_listeners.append(listener)
+        if self._primary_meter is None:
+            return
+        for meter_mac in self._meters:
+            if meter_mac != self._primary_meter:
+                listener(meter_mac)
+
+    def register_primary_meter_listener(self, listener: Callable[[str], None]) -> None:
+        """Register listener, called with the mac of the primary meter when it is first chosen."""
+        self._primary_meter_listeners.append(listener)
+
+    @property
+    def options(self):
+        return self._options
+
+    def meter(self, meter_mac: str = None) -> Emu2MeterState:
+        """Readings for a meter, or the primary meter when meter_mac is None."""
+        return self._meters.get(meter_mac or self._primary_meter)
+
+    @property
+    def meters(self) -> list[str]:
+        return list(self._meters)
+
+    # Add a meter when first seen. Unless one was saved, the first meter a
+    # metering notification arrives for becomes the primary meter, and the
+    # listeners are told about the other meters once it has been chosen.
+    def _add_meter(self, meter_mac: str, metering: bool = True) -> Emu2MeterState:
+        meter = self._meters.get(meter_mac)
+        if meter is None:
+            meter = self._meters[meter_mac] = Emu2MeterState(meter_mac)
+            _LOGGER.debug("Discovered meter %s", meter_mac)
+            # The primary meter may have been saved by an earlier run
+            if self._primary_meter is not None and meter_mac != self._primary_meter:
+                self._announce_meter(meter_mac)
+
+        if self._primary_meter is None and metering:
+            _LOGGER.debug("Primary meter %s", meter_mac)
+            self._primary_meter = meter_mac
+            for listener in self._primary_meter_listeners:
+                listener(meter_mac)
+            for other in self._meters:
+                if other != meter_mac:
+                    self._announce_meter(other)
+        return meter
+
+    def _announce_meter(self, meter_mac: str) -> None:
+        for listener in self._meter_listeners:
+            listener(meter_mac)
+
+    # Ask the device to push the readings which would otherwise need
+    # polling, and for the meters it knows about. Repeated for each
+    # connection, in case the device restarted.
+    async def _configure_schedule(self):
+        while True:
+            await self._emu2.wait_for_state(STATE_STREAMING)
+            await self._emu2.set_schedule(event = 'price', frequency = PRICE_SCHEDULE_INTERVAL, enabled = True)
+            await self._emu2.get_meter_list()
+            await self._emu2.wait_for_state(STATE_CLOSED)
+
+    @property
+    def fast_poll(self) -> bool:
+        return self._fast_poll_task is not None
+
+    @property
+    def fast_poll_frequency(self) -> int:
+        return self._fast_poll_frequency
+
+    @property
+    def fast_poll_late(self) -> int:
+        return self._fast_poll_late
+
+    @property
+    def fast_poll_dropped(self) -> int:
+        return self._fast_poll_dropped
+
+    async def async_set_fast_poll(self, enabled: bool, frequency: int = None) -> None:
+        """Turn high resolution demand on or off."""
+        if frequency is not None:
+            self._fast_poll_frequency = frequency
+
+        if self._fast_poll_task is not None:
+            self._fast_poll_task.cancel()
+            self._fast_poll_task = None
+
+        if enabled:
+            self._fast_poll_late = 0
+            self._fast_poll_dropped = 0
+            self._fast_poll_since = None
+            self._fast_poll_task = self._hass.loop.create_task(self._renew_fast_poll())
+        elif self._emu2.connected:
+            await self._emu2.set_fast_poll(frequency = self._fast_poll_frequency, duration = 0)
+
+    async def _renew_fast_poll(self):
+        reconnected = True
+        while True:
+            await self._emu2.wait_for_state(STATE_STREAMING)
+            if await self._emu2.set_fast_poll(frequency = self._fast_poll_frequency, duration = FAST_POLL_DURATION):
+                if reconnected:
+                    self._fast_poll_since = time.monotonic()
+                    reconnected = False
+
+                # Renew early if the connection drops, the device may have restarted
+                if await self._emu2.wait_for_state(STATE_CLOSED, timeout = (FAST_POLL_DURATION - 1) * 60):
+                    reconnected = True
+            else:
+                await asyncio.sleep(10)
+
+    def _check_fast_poll(self, meter_mac, now) -> None:
+        last = self._last_update.get(('InstantaneousDemand', meter_mac))
+        since = self._fast_poll_since
+        if last is None or since is None or last < since:
+            return
+
+        interval = self._fast_poll_frequency
+        gap = now - last
+        if gap > interval * 1.5:
+            self._fast_poll_late += 1
+            self._fast_poll_dropped += max(0, round(gap / interval) - 1)
+
+    async def async_request_profile_data(self, meter_mac, end_time, channel):
+        return await self._emu2.request_profile_data(mac = meter_mac, end_time = end_time, channel = channel)
+
+    async def _backfill_profile(self):
+        # Imported here as the recorder is only needed when this is enabled
+        from .statistics import async_backfill_profile
+
+        while True:
+            await self._emu2.wait_for_state(STATE_STREAMING)
+            if "recorder" in self._hass.config.components:
+                await self._request_summation_scales()
+                for meter_mac in list(self._meters):
+                    for channel in ('delivered', 'received'):
+                        try:
+                            await async_backfill_profile(self._hass, self, meter_mac, channel)
+                        except asyncio.CancelledError:
+                            raise
+                        except Exception:
+                            _LOGGER.exception("Failed to import %s interval data for %s", channel, meter_mac)
+
+            # Runs again after a reconnect, to fill in the time the device was away
+            if await self._emu2.wait_for_state(STATE_CLOSED, timeout = PROFILE_BACKFILL_INTERVAL):
+                await self._emu2.wait_for_state(STATE_STREAMING)
+                await asyncio.sleep(60)
+
+    # The interval data is converted with the summation format, which
+    # only arrives with CurrentSummationDelivered. Ask for it for each
+    # meter without one, or for the default meter when none is known yet,
+    # rather than waiting for the device to send it.
+    async def _request_summation_scales(self):
+        meter_macs = [meter.meter_mac for meter in self._meters.values() if meter.summation_scale is None]
+        if not self._meters:
+            meter_macs = [None]
+
+        for meter_mac in meter_macs:
+            if await self._emu2.request_current_summation_delivered(meter_mac) is None:
+                _LOGGER.debug("No summation received for %s", meter_mac)
+
+    async def _run_connection(self):
+        # The journal numbers new meters after those in its meters file, so
+        # it has to be open before the first reading arrives
+        if self._journal is not None:
+            await self._async_open_journal()
+        await self._emu2.run()
+
+    async def _async_open_journal(self):
+        try:
+            await self._hass.async_add_executor_job(self._journal.open)
+        except Exception:
+            _LOGGER.exception("Failed to open the reading journal")
+            self._journal = None
+            return
+
+        self._cancel_journal_flush = async_track_time_interval(
+            self._hass, self._async_flush_journal, JOURNAL_FLUSH_INTERVAL
+        )
+        self._journal_task = self._hass.loop.create_task(self._run_journal())
+
+    async def _run_journal(self):
+        # Imported here as the recorder is only needed when this is enabled
+        from .statistics import async_replay_journal
+
+        # Import anything journaled while the recorder was not running
+        while True:
+            if "recorder" in self._hass.config.components:
+                try:
+                    await async_replay_journal(self._hass, self._journal.directory)
+                except Exception:
+                    _LOGGER.exception("Failed to import the reading journal")
+            await asyncio.sleep(PROFILE_BACKFILL_INTERVAL)
+
+    @callback
+    def _async_flush_journal(self, _now = None) -> None:
+        # Batches are written one at a time so they stay in order
+        if self._journal_write is not None and not self._journal_write.done():
+            return
+        if not self._journal.pending:
+            return
+
+        data, meters = self._journal.take()
+        self._journal_write = self._hass.async_add_executor_job(self._journal.write, data, meters)
+        self._journal_write.add_done_callback(functools.partial(self._journal_written, len(data), meters))
+
+    @callback
+    def _journal_written(self, size, meters, future) -> None:
+        if future.cancelled() or future.exception() is None:
+            return
+
+        # The records are lost, but the meters are written with the next
+        # batch so later records still map to the right meter
+        _LOGGER.error("Failed to write %d bytes to the reading journal: %s", size, future.exception())
+        self._journal.restore_meters(meters)
+
+    async def _async_close_journal(self):
+        # Not opened yet
+        if self._cancel_journal_flush is None:
+            return
+        self._cancel_journal_flush()
+        self._cancel_journal_flush = None
+
+        # A failed write has already been logged by _journal_written
+        if self._journal_write is not None:
+            await asyncio.wait((self._journal_write,))
+        data, meters = self._journal.take()
+        try:
+            await self._hass.async_add_executor_job(self._write_and_close_journal, data, meters)
+        except Exception:
+            _LOGGER.exception("Failed to write the reading journal")
+
+    def _write_and_close_journal(self, data, meters):
+        try:
+            self._journal.write(data, meters)
+        finally:
+            self._journal.close()
+
+    @callback
+    def _async_poll_stale(self, _now) -> None:
+        if not self._emu2.connected:
+            return
+
+        now = time.monotonic()
+        for type, (command, window) in FALLBACK_POLLS.items():
+            for meter_mac in self._meters or (None,):
+                last = self._last_update.get((type, meter_mac))
+                if last is None or now - last > window:
+                    _LOGGER.debug("No %s received for %s, requesting it", type, meter_mac)
+                    self._hass.async_create_task(getattr(self._emu2, command)(meter_mac))
 
     def _process_update(self, type, response) -> None:
+        if type == 'MeterList':
+            for meter_mac in response.meter_macs:
+                self._add_meter(meter_mac, metering = False)
+            return
+
+        meter_mac = getattr(response, 'meter_mac', None)
+        if meter_mac is None:
+            # Not associated with a meter
+            self._notify(type, None, response)
+            return
+        meter = self._add_meter(meter_mac, type in METERING_TYPES)
+
+        now = time.monotonic()
+        wall = time.time()
+        if type == 'InstantaneousDemand' and self._fast_poll_task is not None:
+            self._check_fast_poll(meter_mac, now)
+        self._last_update[(type, meter_mac)] = now
+
         if type == 'InstantaneousDemand':
-            self._power = response.reading
+            self._record(meter, 'power', response.reading, now, wall)
 
         elif type == 'CurrentPeriodUsage':
-            self._current_usage = response.reading
-            self._current_usage_start_date = dt.utc_from_timestamp(response.start_date + 946713600)
+            self._record(meter, 'current_usage', response.reading, now, wall)
+            meter.current_usage_start_date = dt.utc_from_timestamp(response.start_date + 946713600)
 
         elif type == 'PriceCluster':
-            self._current_price = response.price_dollars
+            self._record(meter, 'current_price', response.price_dollars, now, wall)
             
         elif type == 'CurrentSummationDelivered':
-            self._summation_delivered = response.delivered
-            self._summation_received = response.received
-
-        for callback in self._callbacks:
-            if (callback[0] == type):
-                callback[1]()
+            self._record(meter, 'summation_delivered', response.delivered, now, wall)
+            self._record(meter, 'summation_received', response.received, now, wall)
+            if response.divisor != 0:
+                meter.summation_scale = response.multiplier / response.divisor
+
+        self._notify(type, meter_mac, response)
+        if meter_mac == self._primary_meter:
+            self._notify(type, None, response)
+
+    def _record(self, meter, name, value, now, wall) -> None:
+        meter._record(name, value, now)
+        if self._journal is not None and value is not None:
+            self._journal.append(wall, meter.meter_mac, name, value)
+
+    def _notify(self, type, meter_mac, response) -> None:
+        subscriptions = self._callbacks.get((type, meter_mac))
+        if not subscriptions:
+            return
+
+        # Copied, as a callback may unsubscribe
+        for subscription in tuple(subscriptions):
+            if subscription.changed is not None:
+                values = tuple(getattr(response, name, None) for name in subscription.changed)
+                if values == subscription.last:
+                    continue
+                subscription.last = values
+
+            subscription.callback()
 
     @property
     def connected(self) -> bool:
         return self._emu2.connected
 
+    @property
+    def emu2(self) -> Emu2:
+        return self._emu2
+
+    @property
+    def metrics(self):
+        """Counters and timings of the connection, or None when not enabled."""
+        return self._emu2.metrics
+
     @property
     def device_id(self) -> str:
         return f"{DEVICE_ID}_{self._properties[ATTR_DEVICE_MAC_ID]}"
@@ -147,26 +694,35 @@ class RainforestEmu2Device:
     def device_hw_version(self) -> str:
         self._properties.get(ATTR_HW_VERSION)
 
+    def _primary_value(self, name):
+        meter = self.meter()
+        if meter is None:
+            return None
+        return getattr(meter, name)
+
     @property
     def power(self) -> float:
-        return self._power
+        return self._primary_value("power")
 
     @property
     def summation_delivered(self) -> float:
-        return self._summation_delivered
+        return self._primary_value("summation_delivered")
     
     @property
     def summation_received(self) -> float:
-        return self._summation_received
+        return self._primary_value("summation_received")
 
     @property
     def current_price(self) -> float:
-        return self._current_price
+        return self._primary_value("current_price")
 
     @property
     def current_usage(self) -> float:
-        return self._current_usage
+        return self._primary_value("current_usage")
 
     @property
     def current_usage_start_date(self) -> datetime:
-        return self._current_usage_start_date
+        meter = self.meter()
+        if meter is None:
+            return dt.utc_from_timestamp(0)
+        return meter.current_usage_start_date
@@ -11,6 +11,7 @@ from serial import Serial, SerialException
 
 from homeassistant import config_entries
 from homeassistant.components import usb
+from homeassistant.core import callback
 from homeassistant.const import (
     ATTR_SW_VERSION,
     ATTR_HW_VERSION,
@@ -23,13 +24,28 @@ from homeassistant.const import (
 from .const import (
     DOMAIN,
     ATTR_DEVICE_PATH,
-    ATTR_DEVICE_MAC_ID
+    ATTR_DEVICE_MAC_ID,
+    CONF_POWER_DEADBAND,
+    CONF_POWER_DEADBAND_PERCENT,
+    CONF_MIN_WRITE_INTERVAL,
+    CONF_MAX_WRITE_AGE,
+    CONF_FAST_POLL_FREQUENCY,
+    CONF_PROFILE_BACKFILL,
+    CONF_JOURNAL,
+    CONF_METRICS,
+    CONF_DECODE_SUBSCRIBED_ONLY,
+    DEFAULT_POWER_DEADBAND,
+    DEFAULT_POWER_DEADBAND_PERCENT,
+    DEFAULT_MIN_WRITE_INTERVAL,
+    DEFAULT_MAX_WRITE_AGE,
+    DEFAULT_FAST_POLL_FREQUENCY,
+    DEFAULT_PROFILE_BACKFILL,
+    DEFAULT_JOURNAL,
+    DEFAULT_METRICS,
+    DEFAULT_DECODE_SUBSCRIBED_ONLY
 )
 from .emu2 import Emu2
-from .emu2_entities import (
-    DeviceInfo,
-    InstantaneousDemand
-)
+from .emu2_entities import InstantaneousDemand
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -41,6 +57,11 @@ class RainforestConfigFlow(config_entries.ConfigFlow, domain = DOMAIN):
 
     VERSION = 1
 
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry):
+        return RainforestOptionsFlow(config_entry)
+
     async def async_step_user(self, user_input = None):
         """Handle the initial step."""
         ports = await self.hass.async_add_executor_job(serial.tools.list_ports.comports)
@@ -131,9 +152,8 @@ class RainforestConfigFlow(config_entries.ConfigFlow, domain = DOMAIN):
         if await emu2.wait_connected(8) == False:
             _LOGGER.debug("Failed to receive data from device")
 
-        await emu2.get_device_info()
+        response = await emu2.request('get_device_info', timeout = 3)
 
-        await asyncio.sleep(3)
         serial_loop_task.cancel()
 
         try:
@@ -143,7 +163,6 @@ class RainforestConfigFlow(config_entries.ConfigFlow, domain = DOMAIN):
 
         await emu2.close()
 
-        response = emu2.get_data(DeviceInfo)
         if response is not None:
             return {
                 ATTR_DEVICE_PATH: device_path,
@@ -169,3 +188,58 @@ class RainforestConfigFlow(config_entries.ConfigFlow, domain = DOMAIN):
 
         _LOGGER.debug("get_devices_properties InstantaneousDemand response is None")
         return None
+
+
+class RainforestOptionsFlow(config_entries.OptionsFlow):
+    """Handle the options for Rainforest EMU-2 integration."""
+
+    def __init__(self, config_entry):
+        self._entry = config_entry
+
+    async def async_step_init(self, user_input = None):
+        """Manage the options."""
+        if user_input is not None:
+            return self.async_create_entry(title = "", data = user_input)
+
+        options = self._entry.options
+        schema = vol.Schema(
+            {
+                vol.Optional(
+                    CONF_POWER_DEADBAND,
+                    default = options.get(CONF_POWER_DEADBAND, DEFAULT_POWER_DEADBAND)
+                ): vol.All(vol.Coerce(float), vol.Range(min = 0)),
+                vol.Optional(
+                    CONF_POWER_DEADBAND_PERCENT,
+                    default = options.get(CONF_POWER_DEADBAND_PERCENT, DEFAULT_POWER_DEADBAND_PERCENT)
+                ): vol.All(vol.Coerce(float), vol.Range(min = 0, max = 100)),
+                vol.Optional(
+                    CONF_MIN_WRITE_INTERVAL,
+                    default = options.get(CONF_MIN_WRITE_INTERVAL, DEFAULT_MIN_WRITE_INTERVAL)
+                ): vol.All(vol.Coerce(float), vol.Range(min = 0)),
+                vol.Optional(
+                    CONF_MAX_WRITE_AGE,
+                    default = options.get(CONF_MAX_WRITE_AGE, DEFAULT_MAX_WRITE_AGE)
+                ): vol.All(vol.Coerce(float), vol.Range(min = 0)),
+                vol.Optional(
+                    CONF_FAST_POLL_FREQUENCY,
+                    default = options.get(CONF_FAST_POLL_FREQUENCY, DEFAULT_FAST_POLL_FREQUENCY)
+                ): vol.All(vol.Coerce(int), vol.Range(min = 1, max = 255)),
+                vol.Optional(
+                    CONF_PROFILE_BACKFILL,
+                    default = options.get(CONF_PROFILE_BACKFILL, DEFAULT_PROFILE_BACKFILL)
+                ): bool,
+                vol.Optional(
+                    CONF_JOURNAL,
+                    default = options.get(CONF_JOURNAL, DEFAULT_JOURNAL)
+                ): bool,
+                vol.Optional(
+                    CONF_METRICS,
+                    default = options.get(CONF_METRICS, DEFAULT_METRICS)
+                ): bool,
+                vol.Optional(
+                    CONF_DECODE_SUBSCRIBED_ONLY,
+                    default = options.get(CONF_DECODE_SUBSCRIBED_ONLY, DEFAULT_DECODE_SUBSCRIBED_ONLY)
+                ): bool,
+            }
+        )
+        return self.async_show_form(step_id = "init", data_schema = schema)
@@ -4,4 +4,42 @@ DEVICE_ID = "emu2"
 DEVICE_NAME = "Rainforest EMU-2"
 
 ATTR_DEVICE_PATH = "device path"
-ATTR_DEVICE_MAC_ID = "device mac id"
\ No newline at end of file
+ATTR_DEVICE_MAC_ID = "device mac id"
+
+# Meter followed by the sensors without a meter, saved once chosen so it
+# stays the same across restarts
+ATTR_PRIMARY_METER_MAC = "primary meter mac id"
+
+# Options controlling how often the power sensor state is written
+CONF_POWER_DEADBAND = "power_deadband"
+CONF_POWER_DEADBAND_PERCENT = "power_deadband_percent"
+CONF_MIN_WRITE_INTERVAL = "min_write_interval"
+CONF_MAX_WRITE_AGE = "max_write_age"
+
+DEFAULT_POWER_DEADBAND = 0.0
+DEFAULT_POWER_DEADBAND_PERCENT = 0.0
+DEFAULT_MIN_WRITE_INTERVAL = 0.0
+DEFAULT_MAX_WRITE_AGE = 0.0
+
+# Seconds between InstantaneousDemand notifications in high resolution mode
+CONF_FAST_POLL_FREQUENCY = "fast_poll_frequency"
+DEFAULT_FAST_POLL_FREQUENCY = 2
+
+# Import hourly statistics from the meter interval data
+CONF_PROFILE_BACKFILL = "profile_backfill"
+DEFAULT_PROFILE_BACKFILL = False
+
+# Keep a journal of the readings on disk, which is imported into the statistics
+CONF_JOURNAL = "journal"
+DEFAULT_JOURNAL = False
+
+# Collect counters and timings of the serial connection
+CONF_METRICS = "metrics"
+DEFAULT_METRICS = False
+
+# Only decode the notifications something is subscribed to
+CONF_DECODE_SUBSCRIBED_ONLY = "decode_subscribed_only"
+DEFAULT_DECODE_SUBSCRIBED_ONLY = False
+
+# hass.data key of the hub shared by every device
+DATA_HUB = f"{DOMAIN}_hub"
@@ -0,0 +1,65 @@
+"""Diagnostics support for Rainforest EMU-2."""
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+from homeassistant.const import CONF_HOST
+
+from .const import DOMAIN, ATTR_DEVICE_MAC_ID, ATTR_PRIMARY_METER_MAC, DATA_HUB
+
+TO_REDACT = {ATTR_DEVICE_MAC_ID, ATTR_PRIMARY_METER_MAC, CONF_HOST}
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    device = hass.data[DOMAIN][entry.entry_id]
+    emu2 = device.emu2
+
+    meters = {}
+    for index, meter_mac in enumerate(device.meters):
+        meter = device.meter(meter_mac)
+        meters[f"meter_{index}"] = {
+            "power": meter.power,
+            "summation_delivered": meter.summation_delivered,
+            "summation_received": meter.summation_received,
+            "current_price": meter.current_price,
+            "readings_kept": {name: len(history) for name, history in meter.history.items()},
+        }
+
+    # Written and suppressed state writes of each sensor with a write policy
+    meter_names = {meter_mac: f"meter_{index}" for index, meter_mac in enumerate(device.meters)}
+    write_policies = {
+        f"{key}_{meter_names.get(meter_mac, 'primary')}": policy.as_dict()
+        for (key, meter_mac), policy in device.write_policies.items()
+    }
+
+    metrics = device.metrics
+    hub = hass.data.get(DATA_HUB)
+    return {
+        "entry": {
+            "data": async_redact_data(entry.data, TO_REDACT),
+            "options": dict(entry.options),
+        },
+        "connection": {
+            "state": emu2.state,
+            "reconnects": emu2.reconnects,
+            "failed_opens": emu2.failed_opens,
+            "command_queue_depth": emu2.command_queue_depth,
+            "commands_written": emu2.commands_written,
+            "command_wait_average": emu2.command_wait_average,
+        },
+        "fast_poll": {
+            "enabled": device.fast_poll,
+            "frequency": device.fast_poll_frequency,
+            "late": device.fast_poll_late,
+            "dropped": device.fast_poll_dropped,
+        },
+        "meters": meters,
+        "write_policies": write_policies,
+        "metrics": metrics.as_dict() if metrics is not None else None,
+        "hub": hub.as_dict() if hub is not None else None,
+    }
@@ -1,31 +1,131 @@
 import asyncio
-import serial_asyncio
+import heapq
 import itertools
+import serial_asyncio
 import logging
+import random
+import time
 from xml.etree import ElementTree
 from serial import SerialException
 
 from . import emu2_entities
+from .emu2_capture import CaptureWriter
+from .emu2_metrics import Metrics
+from .emu2_parser import FrameParser
+from .emu2_scanner import Fragment, Scanner
 
 _LOGGER = logging.getLogger(__name__)
 
+# The response sent by the device for each command that has one
+RESPONSE_TAGS = {
+    'get_connection_status': 'ConnectionStatus',
+    'get_device_info': 'DeviceInfo',
+    'get_schedule': 'ScheduleInfo',
+    'get_meter_list': 'MeterList',
+    'get_meter_info': 'MeterInfo',
+    'get_network_info': 'NetworkInfo',
+    'get_time': 'TimeCluster',
+    'get_message': 'MessageCluster',
+    'get_current_price': 'PriceCluster',
+    'get_instantaneous_demand': 'InstantaneousDemand',
+    'get_current_summation_delivered': 'CurrentSummationDelivered',
+    'get_current_period_usage': 'CurrentPeriodUsage',
+    'get_last_period_usage': 'LastPeriodUsage',
+    'get_profile_data': 'ProfileData',
+}
+
+# Bytes asked for in each read from the connection
+READ_SIZE = 4096
+
+# Connection states
+STATE_CLOSED = "closed"
+STATE_OPENING = "opening"
+STATE_STREAMING = "streaming"
+STATE_STALLED = "stalled"
+
+# Delay before reconnecting, doubled after each failed attempt
+RECONNECT_MIN_DELAY = 1
+RECONNECT_MAX_DELAY = 300
+
+# Command priorities, lower values are written first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+# A command waiting in the queue. Issuing the same command and parameters
+# again while it is waiting shares the pending command.
+class _PendingCommand:
+    __slots__ = ("command", "params", "priority", "seq", "queued", "future")
+
+    def __init__(self, command, params, priority, seq, future):
+        self.command = command
+        self.params = params
+        self.priority = priority
+        self.seq = seq
+        self.queued = time.monotonic()
+        self.future = future
+
 class Emu2:
 
     def __init__(
         self, 
         device,
         host,
-        port
+        port,
+        min_command_gap = 0.1,
+        max_command_gap = 1.0,
+        stall_timeout = 60
     ):
         self._device = device
-        self._connected = False
         self._callback = None
         self._writer = None
         self._reader = None
-        self._writer_lock = asyncio.Lock()
         self._host = host
         self._port = port
         self._data = {}
+        self._waiters = {}
+
+        # The connection is streaming once a frame has been received, and
+        # stalled when nothing has arrived for stall_timeout seconds. A
+        # connection that is still stalled stall_timeout seconds later is
+        # dropped so that run() can reconnect.
+        self._state = STATE_CLOSED
+        self._state_changed = asyncio.Event()
+        self._stall_timeout = stall_timeout
+        self._stall_timer = None
+        self._last_frame = 0.0
+        # Only set when a frame arrives, unlike _last_frame which the
+        # stall check also starts from when the connection opens
+        self._last_received = 0.0
+        self._reconnects = 0
+        self._failed_opens = 0
+
+        # Commands are written one at a time from a queue. After each write
+        # the next command waits until the response arrives, or for
+        # max_command_gap when there is none, but never less than
+        # min_command_gap.
+        self._min_command_gap = min_command_gap
+        self._max_command_gap = max_command_gap
+        self._command_queue = []
+        self._pending_commands = {}
+        self._command_seq = itertools.count()
+        self._command_ready = asyncio.Event()
+        self._command_task = None
+        self._commands_written = 0
+        self._command_wait_total = 0.0
+        self._command_wait_last = 0.0
+
+        # Replaces opening the device or host when set, see use_connection
+        self._connect = None
+        self._capture = None
+
+        # Only kept once enabled, see enable_metrics
+        self._metrics = None
+
+        # Shared with the connections of other devices, see use_hub
+        self._hub = None
+
+        # Tags which are decoded, see set_decode_filter
+        self._decode_filter = None
 
     def get_data(self, klass):
         _LOGGER.debug("Requesting data %s", klass)
@@ -34,8 +134,73 @@ class Emu2:
     def register_process_callback(self, callback):
         self._callback = callback
 
+    @property
+    def state(self) -> str:
+        return self._state
+
+    @property
     def connected(self) -> bool:
-        return self._connected
+        return self._state in (STATE_STREAMING, STATE_STALLED)
+
+    def _set_state(self, state) -> None:
+        if state == self._state:
+            return
+
+        _LOGGER.debug("Connection state %s -> %s", self._state, state)
+        self._state = state
+
+        # Wake everything waiting on the old event, later waiters use a new one
+        state_changed = self._state_changed
+        self._state_changed = asyncio.Event()
+        state_changed.set()
+
+    # Wait until the connection is in one of the given states. Returns
+    # False if the timeout expired first.
+    async def wait_for_state(self, *states, timeout = None) -> bool:
+        if self._state in states:
+            return True
+
+        try:
+            await asyncio.wait_for(self._wait_for_state(states), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def _wait_for_state(self, states):
+        while self._state not in states:
+            await self._state_changed.wait()
+
+    # Number of times run() has reconnected
+    @property
+    def reconnects(self) -> int:
+        return self._reconnects
+
+    # Number of times opening the connection failed
+    @property
+    def failed_opens(self) -> int:
+        return self._failed_opens
+
+    # Number of commands waiting to be written
+    @property
+    def command_queue_depth(self) -> int:
+        return len(self._pending_commands)
+
+    # Number of commands written since the connection was created
+    @property
+    def commands_written(self) -> int:
+        return self._commands_written
+
+    # Time the most recently written command spent in the queue
+    @property
+    def command_wait_last(self) -> float:
+        return self._command_wait_last
+
+    # Average time written commands spent in the queue
+    @property
+    def command_wait_average(self) -> float:
+        if self._commands_written == 0:
+            return 0.0
+        return self._command_wait_total / self._commands_written
 
     async def test_available(self) -> bool:
         if await self.open() == False:
@@ -45,34 +210,110 @@ class Emu2:
         return True
 
     async def wait_connected(self, timeout) -> bool:
-        count = 0
-        while self._connected == False:
-            await asyncio.sleep(1)
+        return await self.wait_for_state(STATE_STREAMING, timeout = timeout)
 
-            count += 1
-            if (count > timeout):
-                return False
+    async def close(self) -> None:
+        if self._command_task is not None:
+            self._command_task.cancel()
+            try:
+                await self._command_task
+            except asyncio.CancelledError:
+                pass
+            self._command_task = None
 
-        return True
+        for pending in self._pending_commands.values():
+            if not pending.future.done():
+                pending.future.set_result(False)
+        self._pending_commands.clear()
+        self._command_queue.clear()
+
+        if self._stall_timer is not None:
+            self._stall_timer.cancel()
+            self._stall_timer = None
 
-    async def close(self) -> None:
         if self._writer is not None:
             self._writer.close()
-            await self._writer.wait_closed()
-        
-        self._connected = False
+            try:
+                await self._writer.wait_closed()
+            except Exception as ex:
+                _LOGGER.debug("Error closing connection: %s", ex)
+            self._writer = None
+            self._reader = None
+
+        self._set_state(STATE_CLOSED)
+
+    # Start collecting counters and timings, returns the Metrics. Passing
+    # an existing Metrics shares it with other connections.
+    def enable_metrics(self, metrics = None) -> Metrics:
+        if metrics is None:
+            metrics = self._metrics or Metrics()
+        self._metrics = metrics
+        return metrics
+
+    @property
+    def metrics(self) -> Metrics:
+        return self._metrics
+
+    # Share the limit on opening connections, reconnect scheduling and
+    # processing time with the other connections in an Emu2Hub. None
+    # leaves the hub.
+    def use_hub(self, hub):
+        if self._hub is not None:
+            self._hub.remove(self)
+        self._hub = hub
+        if hub is not None:
+            hub.add(self)
+
+    # Only decode responses whose tag is in tags, a set or any other
+    # container, which can change afterwards. Responses with other tags are
+    # dropped without building an entity, unless a request is waiting for
+    # them, so they never reach the callback or get_data. None, the default,
+    # decodes every response.
+    def set_decode_filter(self, tags):
+        self._decode_filter = tags
+
+    # Use connect, a coroutine function returning a (reader, writer) pair,
+    # to open the connection instead of the device or host. Used to replay
+    # captures.
+    def use_connection(self, connect):
+        self._connect = connect
+
+    # Record everything read from the device to a capture file, which can
+    # be replayed with emu2_capture.replay_connection
+    def start_capture(self, path) -> CaptureWriter:
+        self.stop_capture()
+        self._capture = CaptureWriter(path)
+        return self._capture
+
+    def stop_capture(self):
+        if self._capture is not None:
+            self._capture.close()
+            self._capture = None
 
     async def open(self) -> bool:
-        if self._connected == True:
+        if self._state != STATE_CLOSED:
             return True
-        if self._host:
+
+        self._set_state(STATE_OPENING)
+        if self._hub is None:
+            return await self._open_connection()
+
+        async with self._hub.opening():
+            return await self._open_connection()
+
+    async def _open_connection(self) -> bool:
+        if self._connect is not None:
+            try:
+                self._reader, self._writer = await self._connect()
+            except Exception as ex:
+                return self._open_failed(ex)
+        elif self._host:
             try:
                     self._reader, self._writer = await asyncio.open_connection(
                         self._host, self._port
                     )
             except Exception as ex:
-                _LOGGER.error(ex)
-                return False           
+                return self._open_failed(ex)
         else:
             try:
                     self._reader, self._writer = await serial_asyncio.open_serial_connection(
@@ -80,44 +321,198 @@ class Emu2:
                         baudrate = 115200
                     )
             except SerialException as ex:
-                _LOGGER.error(ex)
-                return False
+                return self._open_failed(ex)
 
         return True
 
+    def _open_failed(self, ex) -> bool:
+        _LOGGER.error(ex)
+        self._failed_opens += 1
+        if self._metrics is not None:
+            self._metrics.failed_opens += 1
+        self._set_state(STATE_CLOSED)
+        return False
+
+    # Runs every stall_timeout seconds while the connection is open, and
+    # marks the connection stalled if no frame arrived in that time.
+    def _check_stall(self) -> None:
+        idle = time.monotonic() - self._last_frame
+        if idle >= self._stall_timeout:
+            if self._state == STATE_STALLED and self._writer is not None:
+                # Closing the transport ends serial_read
+                _LOGGER.warning("No data received for %d seconds, closing connection", idle)
+                self._writer.close()
+                self._stall_timer = None
+                return
+
+            _LOGGER.warning("No data received for %d seconds", idle)
+            self._set_state(STATE_STALLED)
+            idle = 0
+
+        self._stall_timer = asyncio.get_running_loop().call_later(
+            self._stall_timeout - idle, self._check_stall
+        )
+
+    # Keep the connection open, reconnecting with a jittered exponential
+    # backoff when serial_read ends because the connection failed, was
+    # closed or stayed stalled.
+    async def run(self):
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            await self.serial_read()
+
+            # Only back off further if the connection never produced data
+            if self._last_received > started:
+                attempt = 0
+            await self.close()
+
+            delay = self._reconnect_delay(attempt)
+            attempt += 1
+
+            _LOGGER.info("Reconnecting in %.1f seconds", delay)
+            await asyncio.sleep(delay)
+            self._reconnects += 1
+            if self._metrics is not None:
+                self._metrics.reconnects += 1
+
+    def _reconnect_delay(self, attempt) -> float:
+        if self._hub is not None:
+            return self._hub.reconnect_delay(attempt)
+        delay = min(RECONNECT_MAX_DELAY, RECONNECT_MIN_DELAY * 2 ** attempt)
+        return delay * random.uniform(0.5, 1.0)
+
     async def serial_read(self):
         _LOGGER.info("Starting serial_read loop")
 
         if await self.open() == False:
             return
 
-        response = ''
+        self._last_frame = time.monotonic()
+        self._stall_timer = asyncio.get_running_loop().call_later(
+            self._stall_timeout, self._check_stall
+        )
+
+        # The most frequent notifications are scanned, skipping the XML parser
+        parser = FrameParser(Scanner())
+        turn = 0
         while True:
             try:
-                line = await self._reader.readline()
+                data = await self._reader.read(READ_SIZE)
             except Exception as ex:
                 _LOGGER.error(ex)
-                self._connected = False
+                self._set_state(STATE_CLOSED)
+                break
+
+            if not data:
+                _LOGGER.warning("Connection closed")
+                self._set_state(STATE_CLOSED)
                 break
-            
-            line = line.decode("utf-8").strip()
-            _LOGGER.debug("received %d: %s", len(line), line)
 
-            response += line
-            if line.startswith('</'):
+            if self._capture is not None:
+                self._capture.write(data)
+
+            if _LOGGER.isEnabledFor(logging.DEBUG):
+                _LOGGER.debug("received %d: %s", len(data), data)
+
+            metrics = self._metrics
+            if metrics is not None:
+                failures = parser.failures
+
+            frames = parser.feed(data)
+
+            if metrics is not None:
+                metrics.bytes_read += len(data)
+                metrics.frames += len(frames)
+                metrics.parse_failures += parser.failures - failures
+
+            for tree in frames:
+                self._last_frame = self._last_received = time.monotonic()
+                if self._state != STATE_STREAMING:
+                    self._set_state(STATE_STREAMING)
+
                 try:
-                    self._connected = True
-                    self._process_reply(response)
-                    response = ''
+                    self._process_reply(tree)
                 except Exception as ex:
                     _LOGGER.error("something went wrong: %s", ex)
-
-
-    async def issue_command(self, command, params = None) -> bool:
-        if self._connected == False:
+                    if self._metrics is not None:
+                        self._metrics.decode_errors += 1
+
+            # read returns without yielding while data is buffered, so
+            # give the other connections in the hub a turn
+            if self._hub is not None and frames:
+                turn += len(frames)
+                if turn >= self._hub.frames_per_turn:
+                    turn = 0
+                    await asyncio.sleep(0)
+
+
+    # Queue a command to be written to the device. Returns once the
+    # command has been written, True on success.
+    async def issue_command(self, command, params = None, priority = PRIORITY_BACKGROUND) -> bool:
+        if not self.connected:
             _LOGGER.error("issued command while not connected")
             return False
 
+        key = (command, tuple((k, v) for k, v in (params or {}).items() if v is not None))
+        pending = self._pending_commands.get(key)
+        if pending is None:
+            future = asyncio.get_running_loop().create_future()
+            pending = _PendingCommand(command, params, priority, next(self._command_seq), future)
+            self._pending_commands[key] = pending
+            heapq.heappush(self._command_queue, (priority, pending.seq, key))
+        elif priority < pending.priority:
+            # Move the pending command ahead, the old queue entry is skipped
+            pending.priority = priority
+            pending.seq = next(self._command_seq)
+            heapq.heappush(self._command_queue, (priority, pending.seq, key))
+        else:
+            _LOGGER.debug("Coalesced command %s", command)
+
+        if self._command_task is None or self._command_task.done():
+            self._command_task = asyncio.ensure_future(self._write_commands())
+        self._command_ready.set()
+
+        # Other callers may be waiting on the same command
+        return await asyncio.shield(pending.future)
+
+    async def _write_commands(self):
+        while True:
+            while not self._command_queue:
+                self._command_ready.clear()
+                await self._command_ready.wait()
+
+            _, seq, key = heapq.heappop(self._command_queue)
+            pending = self._pending_commands.get(key)
+            if pending is None or pending.seq != seq:
+                continue
+            del self._pending_commands[key]
+
+            wait = time.monotonic() - pending.queued
+            self._commands_written += 1
+            self._command_wait_total += wait
+            self._command_wait_last = wait
+            if self._metrics is not None:
+                self._metrics.commands_written += 1
+                self._metrics.queue_wait.observe(wait)
+
+            # Register for the response before writing it
+            response_tag = RESPONSE_TAGS.get(pending.command)
+            response = None
+            if response_tag is not None:
+                response = self._add_waiter(response_tag)
+
+            try:
+                result = await self._write_command(pending.command, pending.params)
+                if not pending.future.done():
+                    pending.future.set_result(result)
+
+                await self._command_gap(response if result else None)
+            finally:
+                if response is not None:
+                    self._remove_waiter(response_tag, response)
+
+    async def _write_command(self, command, params) -> bool:
         root = ElementTree.Element('Command')
         name_field = ElementTree.SubElement(root, 'Name')
         name_field.text = command
@@ -133,39 +528,124 @@ class Emu2:
         _LOGGER.debug("XML write %s", bin_string)
 
         try:
-            async with self._writer_lock:
-                self._writer.write(bin_string)
-                await self._writer.drain()
-                # Throttle time between writes
-                await asyncio.sleep(1)
-
-        except SerialException as ex:
+            self._writer.write(bin_string)
+            await self._writer.drain()
+        except (SerialException, OSError) as ex:
             _LOGGER.error(ex)
             return False
 
         return True
 
-    def _process_reply(self, xml_str: str) -> None:
+    # Pace writes so the device is not sent a new command before it has
+    # finished with the last one.
+    async def _command_gap(self, response):
+        start = time.monotonic()
+        if response is not None:
+            # asyncio.wait rather than wait_for, which can swallow a
+            # cancellation that coincides with the response arriving
+            await asyncio.wait((response,), timeout = self._max_command_gap)
+            remaining = self._min_command_gap - (time.monotonic() - start)
+        else:
+            remaining = self._max_command_gap
+
+        if remaining > 0:
+            await asyncio.sleep(remaining)
+
+    def _add_waiter(self, tag):
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(tag, []).append(future)
+        return future
+
+    def _remove_waiter(self, tag, future):
+        waiters = self._waiters.get(tag)
+        if waiters is not None and future in waiters:
+            waiters.remove(future)
+            if not waiters:
+                del self._waiters[tag]
+
+    # Issue a command and wait for the response. The response is matched
+    # on its tag, which is looked up in RESPONSE_TAGS unless an Entity
+    # subclass or tag name is given in expect. Returns the decoded
+    # response, or None if the command could not be written or nothing
+    # arrived within the timeout. Requests are written ahead of background
+    # commands by default.
+    async def request(self, command, params = None, expect = None, timeout = 5, priority = PRIORITY_INTERACTIVE):
+        if expect is None:
+            expect = RESPONSE_TAGS.get(command)
+        elif isinstance(expect, type):
+            expect = expect.tag_name()
+        if expect is None:
+            raise ValueError(f"No known response for command {command}")
+
+        future = self._add_waiter(expect)
+
+        # Stop waiting early if the command was never written
+        def write_done(task):
+            if future.done():
+                return
+            if task.cancelled() or task.exception() is not None or not task.result():
+                future.set_result(None)
+
+        write_task = asyncio.ensure_future(self.issue_command(command, params, priority))
+        write_task.add_done_callback(write_done)
+
         try:
-            wrapped = itertools.chain('<Root>', xml_str, '</Root>')
-            root = ElementTree.fromstringlist(wrapped)
-        except ElementTree.ParseError:
-            _LOGGER.debug("Malformed XML: %s", xml_str)
+            await asyncio.wait((future,), timeout = timeout)
+        finally:
+            self._remove_waiter(expect, future)
+
+        if not future.done():
+            _LOGGER.debug("Timed out waiting for %s in response to %s", expect, command)
+            return None
+        return future.result()
+
+    def _process_reply(self, tree) -> None:
+        response_type = tree.tag
+        klass = emu2_entities.Entity.tag_to_class(response_type)
+        metrics = self._metrics
+        if klass is None:
+            _LOGGER.debug("Unsupported tag: %s", response_type)
+            if metrics is not None:
+                metrics.unknown_frames += 1
             return
 
-        for tree in root:
-            response_type = tree.tag
-            klass = emu2_entities.Entity.tag_to_class(response_type)
-            if klass is None:
-                _LOGGER.debug("Unsupported tag: %s", response_type)
-                continue
+        decode_filter = self._decode_filter
+        if (decode_filter is not None and response_type not in decode_filter
+                and response_type not in self._waiters):
+            if metrics is not None:
+                metrics.skipped_frames += 1
+            return
+
+        if metrics is not None:
+            start = time.perf_counter()
 
-            self._data[response_type] = klass(tree)
+        # The decoded response is immutable, so the cache and the callback
+        # share the same instance. Building it converts the fields the
+        # integration reads, so a frame with bad text raises here and is
+        # never cached.
+        if tree.__class__ is Fragment:
+            response = klass.from_fields(tree.fields)
+        else:
+            response = klass(tree)
+        self._data[response_type] = response
+
+        if metrics is not None:
+            decoded = time.perf_counter()
+            metrics.decode_time.observe(decoded - start)
+
+        # wake up any requests waiting for this response
+        for future in self._waiters.pop(response_type, ()):
+            if not future.done():
+                future.set_result(response)
 
-            # trigger callback
-            if self._callback is not None:
+        # trigger callback
+        if self._callback is not None:
+            if _LOGGER.isEnabledFor(logging.DEBUG):
                 _LOGGER.debug("serial_read callback for response %s", response_type)
-                self._callback(response_type, klass(tree))
+            self._callback(response_type, response)
+
+        if metrics is not None:
+            metrics.fanout_time.observe(time.perf_counter() - decoded)
 
     # Convert boolean to Y/N for commands
     def _format_yn(self, value):
@@ -301,6 +781,11 @@ class Emu2:
         opts = {'MeterMacId': mac, 'Refresh': self._format_yn(refresh)}
         return await self.issue_command('get_current_summation_delivered', opts)
 
+    # As get_current_summation_delivered, returning the CurrentSummationDelivered response or None
+    async def request_current_summation_delivered(self, mac=None, refresh=True, timeout=10):
+        opts = {'MeterMacId': mac, 'Refresh': self._format_yn(refresh)}
+        return await self.request('get_current_summation_delivered', opts, timeout = timeout, priority = PRIORITY_BACKGROUND)
+
     async def get_current_period_usage(self, mac = None):
         opts = {'MeterMacId': mac}
         return await self.issue_command('get_current_period_usage', opts)
@@ -309,6 +794,30 @@ class Emu2:
         opts = {'MeterMacId': mac}
         return await self.issue_command('get_last_period_usage', opts)
 
+    # Interval data for up to 12 periods ending at end_time, in seconds
+    # since the Rainforest epoch. An end_time of 0 ends at the most recent
+    # period.
+    async def get_profile_data(self, mac=None, periods=12, end_time=0, channel='delivered'):
+        opts = self._profile_data_opts(mac, periods, end_time, channel)
+        return await self.issue_command('get_profile_data', opts)
+
+    # As get_profile_data, returning the ProfileData response or None
+    async def request_profile_data(self, mac=None, periods=12, end_time=0, channel='delivered', timeout=10):
+        opts = self._profile_data_opts(mac, periods, end_time, channel)
+        return await self.request('get_profile_data', opts, timeout = timeout, priority = PRIORITY_BACKGROUND)
+
+    def _profile_data_opts(self, mac, periods, end_time, channel):
+        if not 1 <= periods <= 12:
+            raise ValueError('periods must be between 1 and 12')
+        if channel not in ('delivered', 'received'):
+            raise ValueError('channel must be delivered or received')
+        return {
+            'MeterMacId': mac,
+            'NumberOfPeriods': self._format_hex(periods, digits=2),
+            'EndTime': self._format_hex(end_time),
+            'IntervalChannel': channel.capitalize()
+        }
+
     async def close_current_period(self, mac=None):
         opts = {'MeterMacId': mac}
         return await self.issue_command('close_current_period', opts)
@@ -0,0 +1,182 @@
+import re
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .emu2_entities import InstantaneousDemand
+from .emu2_parser import FrameParser
+from .emu2_scanner import Fragment, Scanner
+
+# Batch decoding of InstantaneousDemand notifications into columns, for
+# offline analysis of captures. Needs numpy, which the integration itself
+# does not use.
+#
+# Each notification in the data is a row. A frame in the layout written
+# by the device, with its fields in the usual order and every number
+# written as 0x and hex digits, is cut into columns by a single regular
+# expression over all of the data, and its numbers are converted as
+# arrays. Any other frame is decoded by the XML parser and
+# InstantaneousDemand one at a time. Rows which can't be decoded are left
+# out, as Emu2 would drop them, as are rows with a number that doesn't fit
+# in the unsigned 64 bit columns, which the device never sends. Otherwise
+# the numbers are the same as those of InstantaneousDemand.
+
+_HEX = rb'0[xX]([0-9a-fA-F]{1,16})'
+_TEXT = rb'[^<>&\r\x00-\x08\x0b\x0c\x0e-\x1f\x7f-\xff]*'
+_SPACE = rb'[ \t\r\n]*'
+
+def _field(tag, value):
+    return _SPACE + b'<' + tag + b'>' + value + b'</' + tag + b'>'
+
+# Every opening tag gives a row of the digits of the numbers in COLUMNS,
+# which are empty unless the frame is in the device layout
+_DEMAND = re.compile(
+    rb'<InstantaneousDemand(?=[\s/>])(?:>'
+    + _field(b'DeviceMacId', _TEXT)
+    + _field(b'MeterMacId', _TEXT)
+    + _field(b'TimeStamp', _HEX)
+    + _field(b'Demand', _HEX)
+    + _field(b'Multiplier', _HEX)
+    + _field(b'Divisor', _HEX)
+    + _field(b'DigitsRight', _HEX)
+    + _field(b'DigitsLeft', _TEXT)
+    + _field(b'SuppressLeadingZero', _TEXT)
+    + _SPACE + rb'</InstantaneousDemand>)?'
+)
+_OPEN = re.compile(rb'<InstantaneousDemand(?=[\s/>])')
+
+COLUMNS = ('timestamp', 'demand', 'multiplier', 'divisor', 'digits_right', 'reading')
+
+# Values of hex digits by character, 0xff for anything else
+if np is not None:
+    _DIGITS = np.full(256, 0xff, dtype = np.uint8)
+    _DIGITS[np.frombuffer(b'0123456789', dtype = np.uint8)] = np.arange(10)
+    _DIGITS[np.frombuffer(b'abcdef', dtype = np.uint8)] = np.arange(10, 16)
+    _DIGITS[np.frombuffer(b'ABCDEF', dtype = np.uint8)] = np.arange(10, 16)
+
+# Largest integer a float holds exactly
+_EXACT = 2 ** 53
+
+# Decode up to 16 hex digits per value into a uint64 array
+def _parse_hex(values):
+    digits = np.array(values, dtype = 'S16')
+    if not len(digits):
+        return np.zeros(0, dtype = np.uint64)
+
+    # Digits are left aligned and padded with zero bytes
+    nibbles = _DIGITS[digits.view(np.uint8).reshape(len(digits), 16)]
+    lengths = np.char.str_len(digits)
+
+    result = np.zeros(len(digits), dtype = np.uint64)
+    for column in range(nibbles.shape[1]):
+        present = column < lengths
+        result[present] = (result[present] << np.uint64(4)) | nibbles[present, column]
+    return result
+
+# round(value, digits) for arrays, identical to the builtin round. numpy
+# rounds the value scaled by 10 ** digits, which only differs from the
+# exact decimal rounding of round when the scaled value is within a
+# rounding error of a tie, when it is too large to have a fraction, or
+# when there are too many digits to scale exactly. Those values are
+# rounded with round.
+def _round(values, digits):
+    result = values.copy()
+    if not len(values):
+        return result
+
+    exact = digits <= 15
+    scale = np.power(10.0, np.where(exact, digits, 0))
+    scaled = values * scale
+    fraction = np.abs(scaled - np.floor(scaled) - 0.5)
+    vector = exact & (np.abs(scaled) < _EXACT) & (fraction > 2 * np.spacing(np.abs(scaled)))
+
+    result[vector] = np.rint(scaled[vector]) / scale[vector]
+    for index in np.flatnonzero(~vector):
+        result[index] = round(float(values[index]), int(digits[index]))
+    return result
+
+# Decode every InstantaneousDemand in data, bytes as read from the device,
+# such as a capture or the fragments of one joined together. Returns a
+# dict of numpy arrays, one per name in COLUMNS, with a row per
+# notification in the order they appear.
+def decode_demand(data) -> dict:
+    if np is None:
+        raise ImportError("numpy is needed for batch decoding")
+
+    data = bytes(data)
+    rows = _DEMAND.findall(data)
+    columns = list(zip(*rows)) if rows else [()] * 5
+    timestamp, demand, multiplier, divisor, digits_right = columns
+
+    timestamp = _parse_hex(timestamp)
+    demand = _parse_hex(demand)
+    multiplier = _parse_hex(multiplier)
+    divisor = _parse_hex(divisor)
+    digits_right = _parse_hex(digits_right)
+
+    # Frames not in the device layout have no digits in any group
+    layout = np.array([bool(row[0]) for row in rows], dtype = bool)
+    valid = layout.copy()
+    if not layout.all():
+        _decode_others(data, np.flatnonzero(~layout), valid, timestamp, demand, multiplier, divisor, digits_right)
+
+    # signed32 takes the low 32 bits as two's complement
+    demand = (demand & np.uint64(0xffffffff)).astype(np.uint32).view(np.int32).astype(np.int64)
+
+    # demand * multiplier / float(divisor), where the product is exact as
+    # a float unless the multiplier is too large. A float product of exact
+    # values is then rounded just as float() rounds the integer product.
+    reading = np.zeros(len(demand))
+    scaled = divisor != 0
+    exact = scaled & (multiplier < _EXACT) & (divisor < _EXACT)
+    reading[exact] = (
+        demand[exact].astype(np.float64) * multiplier[exact].astype(np.float64)
+        / divisor[exact].astype(np.float64)
+    )
+    for index in np.flatnonzero(scaled & ~exact):
+        reading[index] = int(demand[index]) * int(multiplier[index]) / float(int(divisor[index]))
+
+    rounded = np.zeros(len(demand))
+    rounded[scaled] = _round(reading[scaled], digits_right[scaled])
+
+    return {
+        'timestamp': timestamp[valid],
+        'demand': demand[valid],
+        'multiplier': multiplier[valid],
+        'divisor': divisor[valid],
+        'digits_right': digits_right[valid],
+        'reading': rounded[valid],
+    }
+
+# Decode the rows at indexes with InstantaneousDemand, filling in the
+# columns, and marking the rows which could not be decoded as not valid.
+# Each frame is parsed from its opening tag up to the next one.
+def _decode_others(data, indexes, valid, timestamp, demand, multiplier, divisor, digits_right):
+    starts = [match.start() for match in _OPEN.finditer(data)]
+    starts.append(len(data))
+    scanner = Scanner()
+
+    for index in indexes:
+        parser = FrameParser(scanner)
+        frames = parser.feed(data[starts[index]:starts[index + 1]])
+        if not frames or frames[0].tag != 'InstantaneousDemand':
+            continue
+
+        frame = frames[0]
+        try:
+            if frame.__class__ is Fragment:
+                response = InstantaneousDemand.from_fields(frame.fields)
+            else:
+                response = InstantaneousDemand(frame)
+
+            # The raw values, as the columns are converted afterwards
+            timestamp[index] = response.timestamp
+            demand[index] = response.demand & 0xffffffff
+            multiplier[index] = response.multiplier
+            divisor[index] = response.divisor
+            digits_right[index] = response.digits_right
+        except (ValueError, OverflowError):
+            continue
+        valid[index] = True
@@ -0,0 +1,120 @@
+import asyncio
+import struct
+import time
+
+# A capture file starts with a header holding the wall clock time the
+# capture started. Each chunk read from the device follows as the seconds
+# since the start and the length, then the bytes themselves.
+HEADER = struct.Struct('<8sd')
+MAGIC = b'EMU2CAP1'
+CHUNK = struct.Struct('<dI')
+
+# Records the chunks read from the device. Writes are buffered by the file
+# object, so recording is cheap enough to leave on in the read loop.
+class CaptureWriter:
+    def __init__(self, path):
+        self._file = open(path, 'wb')
+        self._start = time.monotonic()
+        self._file.write(HEADER.pack(MAGIC, time.time()))
+        self.chunks = 0
+        self.bytes = 0
+
+    # Offset is the seconds since the start, by default the time now
+    def write(self, data, offset = None):
+        if offset is None:
+            offset = time.monotonic() - self._start
+        self._file.write(CHUNK.pack(offset, len(data)))
+        self._file.write(data)
+        self.chunks += 1
+        self.bytes += len(data)
+
+    def close(self):
+        self._file.close()
+
+# The wall clock start time and the (offset, data) chunks of a capture
+def read_capture(path):
+    with open(path, 'rb') as capture_file:
+        data = capture_file.read()
+
+    magic, started = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a capture file")
+
+    chunks = []
+    position = HEADER.size
+    while position + CHUNK.size <= len(data):
+        offset, length = CHUNK.unpack_from(data, position)
+        position += CHUNK.size
+        if position + length > len(data):
+            # Cut off while recording
+            break
+        chunks.append((offset, data[position:position + length]))
+        position += length
+    return started, chunks
+
+# Stands in for the StreamReader of a connection, returning the captured
+# chunks in order and then end of file. With realtime the chunks are
+# returned at the times they were recorded, divided by speed, otherwise
+# as fast as they are read.
+class ReplayReader:
+    def __init__(self, chunks, realtime = False, speed = 1.0):
+        self._chunks = chunks
+        self._index = 0
+        self._realtime = realtime
+        self._speed = speed
+        self._start = None
+
+    async def _next(self):
+        if self._index >= len(self._chunks):
+            return b''
+
+        offset, data = self._chunks[self._index]
+        self._index += 1
+
+        if self._realtime:
+            if self._start is None:
+                self._start = time.monotonic() - offset / self._speed
+            delay = self._start + offset / self._speed - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        elif self._index % 64 == 0:
+            # Let other tasks run, as a real connection would
+            await asyncio.sleep(0)
+        return data
+
+    async def readline(self):
+        return await self._next()
+
+    async def read(self, n = -1):
+        return await self._next()
+
+# Stands in for the StreamWriter of a connection, keeping the commands
+# written to it.
+class ReplayWriter:
+    def __init__(self):
+        self.written = []
+        self._closed = False
+
+    def write(self, data):
+        self.written.append(data)
+
+    async def drain(self):
+        return
+
+    def close(self):
+        self._closed = True
+
+    def is_closing(self):
+        return self._closed
+
+    async def wait_closed(self):
+        return
+
+# A connect function for Emu2.use_connection which replays a capture
+def replay_connection(path, realtime = False, speed = 1.0):
+    _, chunks = read_capture(path)
+
+    async def connect():
+        return ReplayReader(chunks, realtime, speed), ReplayWriter()
+
+    return connect
@@ -1,107 +1,300 @@
 import math
-from xml.etree import ElementTree
+from array import array
+
+# Tag name to Entity subclass, filled in as the subclasses are defined
+_tag_map = {}
+
+# Converters used in the field specs. Each is passed the text of the
+# child element, or None when the element is missing.
+def text(value):
+    return value
+
+def hex_int(value):
+    return int(value or "0x00", 16)
+
+# accept negative numbers
+def signed32(value):
+    value = hex_int(value)
+    return -(value & 0x80000000) | (value & 0x7fffffff)
+
+def yes_no(value):
+    if value is None:
+        return None
+    return value == 'Y'
+
+# Marks a value which has not been decoded yet
+_MISSING = object()
+
+# A field of a response, decoded from the text of its element the first
+# time it is read. Both the text and the decoded value are kept in the
+# _values dict of the response, the text under the tag and the value
+# under the attribute name.
+class _Field:
+    __slots__ = ("tag", "attr", "convert")
+
+    def __init__(self, tag, attr, convert):
+        self.tag = tag
+        self.attr = attr
+        self.convert = convert
+
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self
+        values = obj._values
+        value = values.get(self.attr, _MISSING)
+        if value is _MISSING:
+            value = values[self.attr] = self.convert(values.get(self.tag))
+        return value
+
+    def __set__(self, obj, value):
+        raise AttributeError(f"{type(obj).__name__}.{self.attr} is read-only")
+
+    def __delete__(self, obj):
+        raise AttributeError(f"{type(obj).__name__}.{self.attr} is read-only")
+
+# A value computed from the fields the first time it is read
+class _Derived(_Field):
+    __slots__ = ()
+
+    def __init__(self, attr, compute):
+        super().__init__(None, attr, compute)
+
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self
+        values = obj._values
+        value = values.get(self.attr, _MISSING)
+        if value is _MISSING:
+            value = values[self.attr] = self.convert(obj)
+        return value
 
 # Base class for a response entity. All individual response
 # objects inherit from this.
+#
+# Each class declares its fields as (tag, attribute, converter) in
+# _fields. A single pass over the children of the element keeps the text
+# of each field, and a field is only converted the first time it is read,
+# so fields nobody reads cost nothing beyond keeping their text. Values
+# computed from the fields are declared as (attribute, method) in
+# _derived, and are also computed the first time they are read. Tags
+# which can appear more than once are declared like fields in _lists,
+# and their values are converted up front and kept in a tuple. Children
+# without a field spec are kept in extras, which is None when there are
+# none. The element itself is not retained, and responses use __slots__
+# so that decoded responses stay small.
+#
+# The fields and derived values named in _checked are converted when the
+# response is built, so a response whose text can't be converted raises
+# ValueError then, rather than when it has already been cached and passed
+# on. These are the values the integration reads from every notification.
+#
+# A single decoded response is shared by the data cache and every
+# subscriber, so fields and derived values are read-only, and any other
+# attribute can only be assigned once.
 class Entity:
+    # These tags are common to all responses
+    _fields = (
+        ("DeviceMacId", "device_mac", text),
+    )
+    _checked = ()
+    __slots__ = ("_values", "extras")
+
+    _field_map = {tag: attr for tag, attr, _ in _fields}
+    _list_map = {}
+
     def __init__(self, tree):
-        self._tree = tree
+        fields = self._field_map
+        values = {}
+        extras = None
 
-        # These tags are common to all responses
-        self.device_mac = self.find_text('DeviceMacId')
+        for child in tree:
+            tag = child.tag
+            if tag in fields:
+                # Only the first occurrence of a tag is used
+                if tag not in values:
+                    values[tag] = child.text
+                continue
+
+            field = self._list_map.get(tag)
+            if field is not None:
+                attr, convert = field
+                values.setdefault(attr, []).append(convert(child.text))
+                continue
+
+            if extras is None:
+                extras = {}
+            extras[tag] = child.text
+
+        # Lists which were not found are empty
+        for attr, _ in self._list_map.values():
+            values[attr] = tuple(values.get(attr, ()))
+
+        object.__setattr__(self, "_values", values)
+        object.__setattr__(self, "extras", extras)
+
+        self._parse()
+        for attr in self._checked:
+            getattr(self, attr)
+
+    # Build a response from the text of its fields keyed by tag, as
+    # scanned by emu2_scanner, instead of from an element. Every tag must
+    # be one of field_tags. The dict is kept by the response.
+    @classmethod
+    def from_fields(cls, fields):
+        self = cls.__new__(cls)
+        for attr, _ in cls._list_map.values():
+            fields[attr] = ()
+
+        object.__setattr__(self, "_values", fields)
+        object.__setattr__(self, "extras", None)
 
         self._parse()
+        for attr in self._checked:
+            getattr(self, attr)
+        return self
+
+    def __setattr__(self, name, value):
+        try:
+            object.__getattribute__(self, name)
+        except AttributeError:
+            object.__setattr__(self, name, value)
+            return
+        raise AttributeError(f"{type(self).__name__}.{name} is read-only")
 
-    # def __repr__(self):
-    #     return ElementTree.tostring(self._tree).decode('ASCII')
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__}.{name} is read-only")
 
-    # Hook for subclasses to override to provide special parsing
-    # for computing their parameters.
+    # Hook for subclasses to override to compute values once the fields
+    # have been extracted. Prefer _derived, which only computes a value
+    # when it is read.
     def _parse(self):
         return
 
-    def find_text(self, tag):
-        node = self._tree.find(tag)
-        if node is None:
-            return None
-        return node.text
+    # Every subclass, however deeply nested, is added to the tag map
+    # when it is defined. The field specs and derived values of the base
+    # classes are merged into the subclass, which gets a descriptor for
+    # each of them.
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        field_map = {}
+        list_map = {}
+        for klass in reversed(cls.__mro__):
+            for tag, attr, convert in klass.__dict__.get("_fields", ()):
+                field_map[tag] = (attr, convert)
+            for tag, attr, convert in klass.__dict__.get("_lists", ()):
+                list_map[tag] = (attr, convert)
+            for attr, compute in klass.__dict__.get("_derived", ()):
+                setattr(cls, attr, _Derived(attr, compute))
+        cls._field_map = {tag: attr for tag, (attr, _) in field_map.items()}
+        cls._list_map = list_map
+
+        for tag, (attr, convert) in field_map.items():
+            setattr(cls, attr, _Field(tag, attr, convert))
+        for attr, _ in list_map.values():
+            # Always filled in by __init__
+            setattr(cls, attr, _Field(None, attr, tuple))
 
-    def find_hex(self, text):
-        return int(self.find_text(text) or "0x00", 16)
+        Entity.register(cls)
 
     # The root element associated with this class
     @classmethod
     def tag_name(cls):
         return cls.__name__
 
+    # The tags of the fields of this class, not including lists
+    @classmethod
+    def field_tags(cls):
+        return tuple(cls._field_map)
+
+    # Add a class to the tag map. Can be used to support tags which are
+    # not known by this module, or to map a tag to a different class.
+    @staticmethod
+    def register(klass, tag=None):
+        _tag_map[tag or klass.tag_name()] = klass
+        return klass
+
     # Map the tag name to the type of subclass
     @classmethod
     def tag_to_class(cls, tag):
-        for klass in cls.__subclasses__():
-            if klass.tag_name() == tag:
-                return klass
-        return None
+        return _tag_map.get(tag)
 
 #####################################
 #       Raven Notifications         #
 #####################################
 class ConnectionStatus(Entity):
-    def _parse(self):
-        self.meter_mac = self.find_text('MeterMacId')
-        self.status = self.find_text("Status")
-        self.description = self.find_text("Description")
-        self.status_code = self.find_text("StatusCode")         # 0x00 to 0xFF
-        self.extended_pan_id = self.find_text("ExtPanId")
-        self.channel = self.find_text("Channel")                # 11 to 26
-        self.short_address = self.find_text("ShortAddr")        # 0x0000 to 0xFFFF
-        self.link_strength = self.find_text("LinkStrength")     # 0x00 to 0x64
+    _fields = (
+        ("MeterMacId", "meter_mac", text),
+        ("Status", "status", text),
+        ("Description", "description", text),
+        ("StatusCode", "status_code", text),            # 0x00 to 0xFF
+        ("ExtPanId", "extended_pan_id", text),
+        ("Channel", "channel", text),                   # 11 to 26
+        ("ShortAddr", "short_address", text),           # 0x0000 to 0xFFFF
+        ("LinkStrength", "link_strength", text),        # 0x00 to 0x64
+    )
+    __slots__ = ()
 
 class DeviceInfo(Entity):
-    def _parse(self):
-        self.install_code = self.find_text("InstallCode")
-        self.link_key = self.find_text("LinkKey")
-        self.fw_version = self.find_text("FWVersion")
-        self.hw_version = self.find_text("HWVersion")
-        self.fw_image_type = self.find_text("ImageType")
-        self.manufacturer = self.find_text("Manufacturer")
-        self.model_id = self.find_text("ModelId")
-        self.date_code = self.find_text("DateCode")
+    _fields = (
+        ("InstallCode", "install_code", text),
+        ("LinkKey", "link_key", text),
+        ("FWVersion", "fw_version", text),
+        ("HWVersion", "hw_version", text),
+        ("ImageType", "fw_image_type", text),
+        ("Manufacturer", "manufacturer", text),
+        ("ModelId", "model_id", text),
+        ("DateCode", "date_code", text),
+    )
+    __slots__ = ()
 
 class ScheduleInfo(Entity):
-    def _parse(self):
-        self.meter_mac = self.find_text("MeterMacId")
-        self.event = self.find_text("Event")
-        self.frequency = self.find_text("Frequency")
-        self.enabled = self.find_text("Enabled")
+    _fields = (
+        ("MeterMacId", "meter_mac", text),
+        ("Event", "event", text),
+        ("Frequency", "frequency", text),
+        ("Enabled", "enabled", yes_no),
+    )
+    __slots__ = ()
 
-# TODO: There can be more than one MeterMacId
 class MeterList(Entity):
-    def _parse(self):
-        self.meter_mac = self.find_text("MeterMacId")
+    _lists = (
+        ("MeterMacId", "meter_macs", text),
+    )
+    __slots__ = ()
+
+    def _meter_mac(self):
+        return self.meter_macs[0] if self.meter_macs else None
+
+    _derived = (("meter_mac", _meter_mac),)
 
 #####################################
 #       Meter Notifications         #
 #####################################
 class MeterInfo(Entity):
-    def _parse(self):
-        self.meter_mac = self.find_text("MeterMacId")
-        self.meter_type = self.find_text("MeterType")
-        self.nickname = self.find_text("NickName")
-        self.account = self.find_text("Account")
-        self.auth = self.find_text("Auth")
-        self.host = self.find_text("Host")
-        self.enabled = self.find_text("Enabled")
+    _fields = (
+        ("MeterMacId", "meter_mac", text),
+        ("MeterType", "meter_type", text),
+        ("NickName", "nickname", text),
+        ("Account", "account", text),
+        ("Auth", "auth", text),
+        ("Host", "host", text),
+        ("Enabled", "enabled", yes_no),
+    )
+    __slots__ = ()
 
 class NetworkInfo(Entity):
-    def _parse(self):
-        self.coordinator_mac = self.find_text("CoordMacId")
-        self.status = self.find_text("Status")
-        self.description = self.find_text("Description")
-        self.status_code = self.find_text("StatusCode")
-        self.extended_pan_id = self.find_text("ExtPanId")
-        self.channel = self.find_text("Channel")
-        self.short_address = self.find_text("ShortAddr")
-        self.link_strength = self.find_text("LinkStrength")
+    _fields = (
+        ("CoordMacId", "coordinator_mac", text),
+        ("Status", "status", text),
+        ("Description", "description", text),
+        ("StatusCode", "status_code", text),
+        ("ExtPanId", "extended_pan_id", text),
+        ("Channel", "channel", text),
+        ("ShortAddr", "short_address", text),
+        ("LinkStrength", "link_strength", text),
+    )
+    __slots__ = ()
 
 #####################################
 #        Time Notifications         #
@@ -109,125 +302,187 @@ class NetworkInfo(Entity):
 
 # TODO: Convert from Rainforest epoch
 class TimeCluster(Entity):
-    def _parse(self):
-        self.meter_mac = self.find_text("MeterMacId")
-        self.utc_time = self.find_text("UTCTime")
-        self.local_time = self.find_text("LocalTime")
+    _fields = (
+        ("MeterMacId", "meter_mac", text),
+        ("UTCTime", "utc_time", text),
+        ("LocalTime", "local_time", text),
+    )
+    __slots__ = ()
 
 #####################################
 #      Message Notifications        #
 #####################################
 class MessageCluster(Entity):
-    def _parse(self):
-        self.meter_mac = self.find_text("MeterMacId")
-        self.timestamp = self.find_hex("TimeStamp")
-        self.id = self.find_text("Id")
-        self.text = self.find_text("Text")
-        self.confirmation_required = self.find_text("ConfirmationRequired")
-        self.confirmed = self.find_text("Confirmed")
-        self.queue = self.find_text("Queue")
+    _fields = (
+        ("MeterMacId", "meter_mac", text),
+        ("TimeStamp", "timestamp", hex_int),
+        ("Id", "id", text),
+        ("Text", "text", text),
+        ("ConfirmationRequired", "confirmation_required", yes_no),
+        ("Confirmed", "confirmed", yes_no),
+        ("Queue", "queue", text),
+    )
+    __slots__ = ()
 
 #####################################
 #        Price Notifications        #
 #####################################
 class PriceCluster(Entity):
-    def _parse(self):
-        self.meter_mac = self.find_text("MeterMacId")
-        self.timestamp = self.find_hex("TimeStamp")
-        self.price = self.find_hex("Price")
-        self.currency = self.find_text("Currency")      # ISO-4217
-        self.trailing_digits = self.find_hex("TrailingDigits")
-        self.tier = self.find_text("Tier")
-        self.tier_label = self.find_text("TierLabel")
-        self.rate_label = self.find_text("RateLabel")
+    _fields = (
+        ("MeterMacId", "meter_mac", text),
+        ("TimeStamp", "timestamp", hex_int),
+        ("Price", "price", hex_int),
+        ("Currency", "currency", text),                 # ISO-4217
+        ("TrailingDigits", "trailing_digits", hex_int),
+        ("Tier", "tier", text),
+        ("TierLabel", "tier_label", text),
+        ("RateLabel", "rate_label", text),
+    )
+    __slots__ = ()
 
+    def _price_dollars(self):
         if (self.price != 0xffffffff):
-            self.price_dollars = self.price / math.pow(10, self.trailing_digits)
-        else:
-            self.price_dollars = None
+            return self.price / math.pow(10, self.trailing_digits)
+        return None
+
+    _derived = (("price_dollars", _price_dollars),)
+    _checked = ("price_dollars",)
 
 #####################################
 #   Simple Metering Notifications   #
 #####################################
 class InstantaneousDemand(Entity):
-    def _parse(self):
-        self.meter_mac = self.find_text("MeterMacId")
-        self.timestamp = self.find_hex("TimeStamp")
-        self.demand = self.find_hex("Demand")
-        self.multiplier = self.find_hex("Multiplier")
-        self.divisor = self.find_hex("Divisor")
-        self.digits_right = self.find_hex("DigitsRight")
-        self.digits_left = self.find_hex("DigitsLeft")
-        self.suppress_leading_zero = self.find_text("SuppressLeadingZero")
-
-        # accept negative numbers
-        self.demand = -(self.demand & 0x80000000) | (self.demand & 0x7fffffff)
-
-        # Compute actual reading (protecting from divide-by-zero)
-        if self.divisor != 0:
-            self.reading = round(self.demand * self.multiplier / float(self.divisor), self.digits_right)
-        else:
-            self.reading = 0
+    _fields = (
+        ("MeterMacId", "meter_mac", text),
+        ("TimeStamp", "timestamp", hex_int),
+        ("Demand", "demand", signed32),
+        ("Multiplier", "multiplier", hex_int),
+        ("Divisor", "divisor", hex_int),
+        ("DigitsRight", "digits_right", hex_int),
+        ("DigitsLeft", "digits_left", hex_int),
+        ("SuppressLeadingZero", "suppress_leading_zero", yes_no),
+    )
+    __slots__ = ()
+
+    # Compute actual reading (protecting from divide-by-zero)
+    def _reading(self):
+        divisor = self.divisor
+        if divisor != 0:
+            return round(self.demand * self.multiplier / float(divisor), self.digits_right)
+        return 0
+
+    _derived = (("reading", _reading),)
+    _checked = ("reading",)
 
 class CurrentSummationDelivered(Entity):
-    def _parse(self):
-        self.meter_mac = self.find_text("MeterMacId")
-        self.timestamp = self.find_hex("TimeStamp")
-        self.summation_delivered = self.find_hex("SummationDelivered")
-        self.summation_received = self.find_hex("SummationReceived")
-        self.multiplier = self.find_hex("Multiplier")
-        self.divisor = self.find_hex("Divisor")
-        self.digits_right = self.find_hex("DigitsRight")
-        self.digits_left = self.find_hex("DigitsLeft")
-        self.suppress_leading_zero = self.find_text("SuppressLeadingZero")
-
-        # Compute actual reading (protecting from divide-by-zero)
-        if self.divisor != 0:
-            self.delivered = round(self.summation_delivered * self.multiplier / float(self.divisor), self.digits_right)
-            self.received = round(self.summation_received * self.multiplier / float(self.divisor), self.digits_right)
-        else:
-            self.delivered = 0
-            self.received = 0
+    _fields = (
+        ("MeterMacId", "meter_mac", text),
+        ("TimeStamp", "timestamp", hex_int),
+        ("SummationDelivered", "summation_delivered", hex_int),
+        ("SummationReceived", "summation_received", hex_int),
+        ("Multiplier", "multiplier", hex_int),
+        ("Divisor", "divisor", hex_int),
+        ("DigitsRight", "digits_right", hex_int),
+        ("DigitsLeft", "digits_left", hex_int),
+        ("SuppressLeadingZero", "suppress_leading_zero", yes_no),
+    )
+    __slots__ = ()
+
+    # Compute actual readings (protecting from divide-by-zero)
+    def _scaled(self, value):
+        divisor = self.divisor
+        if divisor != 0:
+            return round(value * self.multiplier / float(divisor), self.digits_right)
+        return 0
+
+    def _delivered(self):
+        return self._scaled(self.summation_delivered)
+
+    def _received(self):
+        return self._scaled(self.summation_received)
+
+    _derived = (("delivered", _delivered), ("received", _received))
+    _checked = ("delivered", "received")
 
 class CurrentPeriodUsage(Entity):
-    def _parse(self):
-        self.meter_mac = self.find_text("MeterMacId")
-        self.timestamp = self.find_hex("TimeStamp")
-        self.current_usage = self.find_hex("CurrentUsage")
-        self.multiplier = self.find_hex("Multiplier")
-        self.divisor = self.find_hex("Divisor")
-        self.digits_right = self.find_hex("DigitsRight")
-        self.digits_left = self.find_hex("DigitsLeft")
-        self.suppress_leading_zero = self.find_text("SuppressLeadingZero")
-        self.start_date = self.find_hex("StartDate")
-
-        # accept negative numbers
-        self.current_usage = -(self.current_usage & 0x80000000) | (self.current_usage & 0x7fffffff)
-
-        # Compute actual reading (protecting from divide-by-zero)
-        if self.divisor != 0:
-            self.reading = round(self.current_usage * self.multiplier / float(self.divisor), self.digits_right)
-        else:
-            self.reading = 0
+    _fields = (
+        ("MeterMacId", "meter_mac", text),
+        ("TimeStamp", "timestamp", hex_int),
+        ("CurrentUsage", "current_usage", signed32),
+        ("Multiplier", "multiplier", hex_int),
+        ("Divisor", "divisor", hex_int),
+        ("DigitsRight", "digits_right", hex_int),
+        ("DigitsLeft", "digits_left", hex_int),
+        ("SuppressLeadingZero", "suppress_leading_zero", yes_no),
+        ("StartDate", "start_date", hex_int),
+    )
+    __slots__ = ()
+
+    # Compute actual reading (protecting from divide-by-zero)
+    def _reading(self):
+        divisor = self.divisor
+        if divisor != 0:
+            return round(self.current_usage * self.multiplier / float(divisor), self.digits_right)
+        return 0
+
+    _derived = (("reading", _reading),)
+    _checked = ("reading", "start_date")
 
 class LastPeriodUsage(Entity):
-    def _parse(self):
-        self.meter_mac = self.find_text("MeterMacId")
-        self.last_usage = self.find_hex("LastUsage")
-        self.multiplier = self.find_hex("Multiplier")
-        self.divisor = self.find_hex("Divisor")
-        self.digits_right = self.find_hex("DigitsRight")
-        self.digits_left = self.find_hex("DigitsLeft")
-        self.suppress_leading_zero = self.find_text("SuppressLeadingZero")
-        self.start_date = self.find_hex("StartDate")
-        self.end_date = self.find_hex("EndDate")
-
-# TODO: IntervalData may appear more than once
+    _fields = (
+        ("MeterMacId", "meter_mac", text),
+        ("LastUsage", "last_usage", hex_int),
+        ("Multiplier", "multiplier", hex_int),
+        ("Divisor", "divisor", hex_int),
+        ("DigitsRight", "digits_right", hex_int),
+        ("DigitsLeft", "digits_left", hex_int),
+        ("SuppressLeadingZero", "suppress_leading_zero", yes_no),
+        ("StartDate", "start_date", hex_int),
+        ("EndDate", "end_date", hex_int),
+    )
+    __slots__ = ()
+
+# Length in seconds of each ProfileIntervalPeriod
+PROFILE_INTERVAL_SECONDS = {
+    0: 86400,
+    1: 3600,
+    2: 1800,
+    3: 900,
+    4: 600,
+    5: 450,
+    6: 300,
+    7: 150,
+}
+
+# Interval values which could not be read by the meter
+PROFILE_INVALID_INTERVAL = 0xffffff
+
 class ProfileData(Entity):
-    def _parse(self):
-        self.meter_mac = self.find_text("MeterMacId")
-        self.end_time = self.find_text("EndTime")
-        self.status = self.find_text("Status")
-        self.period_interval = self.find_text("ProfileIntervalPeriod")
-        self.number_of_periods = self.find_text("NumberOfPeriodsDelivered")
-        self.interval_data = self.find_text("IntervalData")
+    _fields = (
+        ("MeterMacId", "meter_mac", text),
+        ("EndTime", "end_time", hex_int),
+        ("Status", "status", hex_int),                  # 0x00 is success
+        ("ProfileIntervalPeriod", "period_interval", hex_int),
+        ("NumberOfPeriodsDelivered", "number_of_periods", hex_int),
+    )
+    # Each IntervalData holds one or more comma separated values
+    _lists = (
+        ("IntervalData", "interval_data", text),
+    )
+    __slots__ = ()
+
+    # The raw interval values, the most recent first, ending at end_time.
+    # The array is shared with every subscriber and must not be modified.
+    def _intervals(self):
+        intervals = array('L')
+        for data in self.interval_data:
+            for value in (data or "").split(','):
+                value = value.strip()
+                if value:
+                    intervals.append(int(value, 16))
+        return intervals
+
+    def _interval_seconds(self):
+        return PROFILE_INTERVAL_SECONDS.get(self.period_interval)
+
+    _derived = (("intervals", _intervals), ("interval_seconds", _interval_seconds))
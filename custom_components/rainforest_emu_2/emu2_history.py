@@ -0,0 +1,168 @@
+from array import array
+from collections import deque
+
+# Window lengths, in seconds, that aggregates are kept for
+WINDOWS = (60, 300, 900)
+
+# Enough for 15 minutes of readings at a one second fast poll rate
+DEFAULT_CAPACITY = 1024
+
+# A sliding window over the newest readings of a ReadingHistory. start is
+# the sequence number of the oldest reading in the window, and the min
+# and max deques hold the sequence numbers of the readings which can still
+# become the minimum or maximum, so each reading is added and removed at
+# most once.
+class _Window:
+    __slots__ = ("span", "start", "total", "mins", "maxs")
+
+    def __init__(self, span):
+        self.span = span
+        self.start = 0
+        self.total = 0.0
+        self.mins = deque()
+        self.maxs = deque()
+
+# Fixed size ring buffer of (timestamp, value) readings, with the min, max,
+# mean and rate of change over each window updated as readings are added.
+#
+# Readings are numbered by a sequence number that keeps counting up, the
+# slot of a reading is its sequence number modulo the capacity. Timestamps
+# are in seconds and are expected to be increasing, time.monotonic() is
+# the usual source.
+class ReadingHistory:
+    def __init__(self, capacity = DEFAULT_CAPACITY, windows = WINDOWS):
+        self._capacity = capacity
+        self._times = array('d', bytes(8 * capacity))
+        self._values = array('d', bytes(8 * capacity))
+        self._next = 0
+        self._windows = {span: _Window(span) for span in windows}
+
+    def __len__(self):
+        return min(self._next, self._capacity)
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def windows(self):
+        return tuple(self._windows)
+
+    # The newest (timestamp, value), or None when empty
+    @property
+    def latest(self):
+        if self._next == 0:
+            return None
+        slot = (self._next - 1) % self._capacity
+        return self._times[slot], self._values[slot]
+
+    def append(self, timestamp: float, value: float) -> None:
+        seq = self._next
+        slot = seq % self._capacity
+        self._times[slot] = timestamp
+        self._values[slot] = value
+        self._next = seq + 1
+
+        values = self._values
+        for window in self._windows.values():
+            window.total += value
+
+            mins = window.mins
+            while mins and values[mins[-1] % self._capacity] >= value:
+                mins.pop()
+            mins.append(seq)
+
+            maxs = window.maxs
+            while maxs and values[maxs[-1] % self._capacity] <= value:
+                maxs.pop()
+            maxs.append(seq)
+
+            self._expire(window, timestamp)
+
+    # All (timestamp, value) readings still in the buffer, oldest first
+    def readings(self):
+        for seq in range(max(0, self._next - self._capacity), self._next):
+            slot = seq % self._capacity
+            yield self._times[slot], self._values[slot]
+
+    # Drop readings that are older than the window, or that have been
+    # overwritten because the buffer is too small for the window.
+    def _expire(self, window, now):
+        cutoff = now - window.span
+        oldest = max(0, self._next - self._capacity)
+        times = self._times
+        values = self._values
+
+        start = window.start
+        while start < self._next and (start < oldest or times[start % self._capacity] < cutoff):
+            if start >= oldest:
+                window.total -= values[start % self._capacity]
+            start += 1
+
+        # Readings overwritten before expiring were never subtracted
+        if start > window.start and window.start < oldest:
+            window.total = sum(values[seq % self._capacity] for seq in range(start, self._next))
+
+        window.start = start
+        if start == self._next:
+            # Avoid carrying rounding errors into the next reading
+            window.total = 0.0
+
+        while window.mins and window.mins[0] < start:
+            window.mins.popleft()
+        while window.maxs and window.maxs[0] < start:
+            window.maxs.popleft()
+
+    def _window(self, span, now):
+        window = self._windows[span]
+        if now is not None:
+            self._expire(window, now)
+        return window
+
+    # Number of readings in the window. When now is given the window ends
+    # at now, otherwise at the newest reading.
+    def count(self, span, now = None) -> int:
+        window = self._window(span, now)
+        return self._next - window.start
+
+    def min(self, span, now = None):
+        window = self._window(span, now)
+        if not window.mins:
+            return None
+        return self._values[window.mins[0] % self._capacity]
+
+    def max(self, span, now = None):
+        window = self._window(span, now)
+        if not window.maxs:
+            return None
+        return self._values[window.maxs[0] % self._capacity]
+
+    def mean(self, span, now = None):
+        window = self._window(span, now)
+        count = self._next - window.start
+        if count == 0:
+            return None
+        return window.total / count
+
+    # Change per second between the oldest and newest reading in the
+    # window, or None with fewer than two readings.
+    def rate(self, span, now = None):
+        window = self._window(span, now)
+        if self._next - window.start < 2:
+            return None
+
+        first = window.start % self._capacity
+        last = (self._next - 1) % self._capacity
+        elapsed = self._times[last] - self._times[first]
+        if elapsed <= 0:
+            return None
+        return (self._values[last] - self._values[first]) / elapsed
+
+    def stats(self, span, now = None):
+        return {
+            "min": self.min(span, now),
+            "max": self.max(span, now),
+            "mean": self.mean(span),
+            "rate": self.rate(span),
+            "count": self.count(span),
+        }
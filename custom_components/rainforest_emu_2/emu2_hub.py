@@ -0,0 +1,87 @@
+import asyncio
+import random
+import time
+
+from .emu2 import RECONNECT_MIN_DELAY, RECONNECT_MAX_DELAY
+from .emu2_metrics import Metrics
+
+# Connections opened at the same time, across every device
+DEFAULT_MAX_OPENING = 4
+
+# Frames a connection processes before letting the other connections run
+DEFAULT_FRAMES_PER_TURN = 16
+
+# Reconnects are spread at least this many seconds apart, so that devices
+# behind the same converter don't all reconnect at once when it restarts.
+DEFAULT_RECONNECT_SPACING = 0.5
+
+# Resources shared by the Emu2 connections of several devices on the same
+# event loop. Each Emu2 joins with Emu2.use_hub.
+#
+# Opens are limited to max_opening at a time, reconnects are scheduled
+# from a single timeline so they are spread out, and each connection
+# yields to the others after frames_per_turn frames, so a device that is
+# sending a lot of data can't hold up the rest.
+class Emu2Hub:
+    def __init__(
+        self,
+        max_opening = DEFAULT_MAX_OPENING,
+        frames_per_turn = DEFAULT_FRAMES_PER_TURN,
+        reconnect_spacing = DEFAULT_RECONNECT_SPACING
+    ):
+        self._opening = asyncio.Semaphore(max_opening)
+        self._frames_per_turn = frames_per_turn
+        self._reconnect_spacing = reconnect_spacing
+        self._next_reconnect = 0.0
+        self._connections = []
+
+    @property
+    def frames_per_turn(self) -> int:
+        return self._frames_per_turn
+
+    @property
+    def connections(self) -> list:
+        return list(self._connections)
+
+    def add(self, emu2) -> None:
+        if emu2 not in self._connections:
+            self._connections.append(emu2)
+
+    def remove(self, emu2) -> None:
+        if emu2 in self._connections:
+            self._connections.remove(emu2)
+
+    # Held while a connection is being opened
+    def opening(self):
+        return self._opening
+
+    # Seconds to wait before the next reconnect attempt. The jittered
+    # exponential backoff of the connection is pushed back when needed so
+    # no two reconnects are scheduled within reconnect_spacing.
+    def reconnect_delay(self, attempt: int) -> float:
+        delay = min(RECONNECT_MAX_DELAY, RECONNECT_MIN_DELAY * 2 ** attempt)
+        delay *= random.uniform(0.5, 1.0)
+
+        now = time.monotonic()
+        at = max(now + delay, self._next_reconnect)
+        self._next_reconnect = at + self._reconnect_spacing
+        return at - now
+
+    # The metrics of every connection which has them enabled, added up
+    def metrics(self):
+        total = None
+        for emu2 in self._connections:
+            if emu2.metrics is not None:
+                if total is None:
+                    total = Metrics()
+                total.merge(emu2.metrics)
+        return total
+
+    def as_dict(self) -> dict:
+        metrics = self.metrics()
+        return {
+            "connections": len(self._connections),
+            "streaming": sum(1 for emu2 in self._connections if emu2.connected),
+            "reconnects": sum(emu2.reconnects for emu2 in self._connections),
+            "metrics": metrics.as_dict() if metrics is not None else None,
+        }
@@ -0,0 +1,209 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+
+_LOGGER = logging.getLogger(__name__)
+
+# Each journal file starts with a header, followed by fixed width records
+# of (unix time, meter index, reading type, value). A record is never
+# split across files.
+HEADER = struct.Struct('<6sH')
+MAGIC = b'EMU2JR'
+VERSION = 1
+RECORD = struct.Struct('<dHBxd')
+
+# Reading types, in the order they are numbered in the records
+READINGS = ('power', 'summation_delivered', 'summation_received', 'current_price', 'current_usage')
+READING_TYPES = {name: index for index, name in enumerate(READINGS)}
+
+# The meter mac of each meter index, one per line in the order they were
+# first journaled
+METERS_FILE = 'meters'
+
+FILE_PREFIX = 'journal-'
+FILE_SUFFIX = '.bin'
+
+DEFAULT_MAX_SIZE = 4 * 1024 * 1024
+DEFAULT_KEEP = 8
+
+# Append-only journal of readings, kept as a set of files in a directory.
+#
+# append() only packs the record into an in-memory buffer, so it can be
+# called from the event loop. take() hands the buffered records over, and
+# write() appends them to the journal, so a whole batch costs a single
+# write call and can be run in an executor. Only write() and the read
+# functions touch the disk.
+#
+# A crash can leave a partial record at the end of the newest file, which
+# is cut off the next time the journal is opened.
+class Journal:
+    def __init__(self, directory, max_size = DEFAULT_MAX_SIZE, keep = DEFAULT_KEEP):
+        self._directory = directory
+        self._max_size = max_size
+        self._keep = keep
+
+        self._buffer = bytearray()
+        self._meters = {}
+        self._new_meters = []
+        self._lock = threading.Lock()
+        self._file = None
+        self._size = 0
+
+    @property
+    def directory(self):
+        return self._directory
+
+    # Number of bytes waiting to be written
+    @property
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    # Read the meter list and repair the newest file. Blocking, run it in
+    # an executor before the first write.
+    def open(self):
+        with self._lock:
+            os.makedirs(self._directory, exist_ok = True)
+            for index, meter_mac in enumerate(read_meters(self._directory)):
+                self._meters.setdefault(meter_mac, index)
+
+            files = journal_files(self._directory)
+            if files:
+                self._open_file(files[-1])
+            else:
+                self._new_file(1)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    # Meters are numbered after those read from the meters file, so
+    # open() must have finished before the first append
+    def append(self, timestamp, meter_mac, reading, value):
+        index = self._meters.get(meter_mac)
+        if index is None:
+            index = self._meters[meter_mac] = len(self._meters)
+            self._new_meters.append(meter_mac)
+
+        self._buffer += RECORD.pack(timestamp, index, READING_TYPES[reading], value)
+
+    # The buffered records and new meters, which are then cleared
+    def take(self):
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        meters = self._new_meters
+        self._new_meters = []
+        return data, meters
+
+    # Put back the new meters of a batch which failed to write, ahead of
+    # any added since, so they are written with the next batch
+    def restore_meters(self, meters):
+        self._new_meters[:0] = meters
+
+    # Append a batch from take(). Blocking. Meters already in the meters
+    # file are not added again, so a batch can be retried.
+    def write(self, data, meters = ()):
+        with self._lock:
+            if meters:
+                written = set(read_meters(self._directory))
+                meters = [meter_mac for meter_mac in meters if meter_mac not in written]
+            if meters:
+                with open(os.path.join(self._directory, METERS_FILE), 'a', encoding = 'ascii') as meters_file:
+                    meters_file.writelines(f"{meter_mac}\n" for meter_mac in meters)
+
+            if not data:
+                return
+
+            if self._file is None or self._size + len(data) > self._max_size:
+                self._rotate()
+
+            self._file.write(data)
+            self._file.flush()
+            self._size += len(data)
+
+    def _open_file(self, path):
+        size = os.path.getsize(path)
+        if size < HEADER.size:
+            os.remove(path)
+            self._new_file(_file_number(path))
+            return
+
+        partial = (size - HEADER.size) % RECORD.size
+        self._file = open(path, 'r+b')
+        if partial:
+            _LOGGER.warning("Dropping a partial record from the end of %s", path)
+            size -= partial
+            self._file.truncate(size)
+        self._file.seek(size)
+        self._size = size
+
+    def _new_file(self, number):
+        path = os.path.join(self._directory, f"{FILE_PREFIX}{number:06d}{FILE_SUFFIX}")
+        self._file = open(path, 'xb')
+        self._file.write(HEADER.pack(MAGIC, VERSION))
+        self._size = HEADER.size
+
+    def _rotate(self):
+        files = journal_files(self._directory)
+        number = _file_number(files[-1]) + 1 if files else 1
+
+        if self._file is not None:
+            self._file.close()
+        self._new_file(number)
+
+        for path in files[:max(0, len(files) + 1 - self._keep)]:
+            os.remove(path)
+
+def _file_number(path):
+    name = os.path.basename(path)
+    return int(name[len(FILE_PREFIX):-len(FILE_SUFFIX)])
+
+# Journal files in the directory, oldest first
+def journal_files(directory):
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    names = [name for name in names if name.startswith(FILE_PREFIX) and name.endswith(FILE_SUFFIX)]
+    return [os.path.join(directory, name) for name in sorted(names)]
+
+def read_meters(directory):
+    try:
+        with open(os.path.join(directory, METERS_FILE), encoding = 'ascii') as meters_file:
+            return [line.strip() for line in meters_file if line.strip()]
+    except FileNotFoundError:
+        return []
+
+# The (timestamp, meter index, reading type, value) records of a single
+# file. The file is memory mapped, and a partial record at the end is
+# ignored.
+def read_file(path):
+    with open(path, 'rb') as journal_file:
+        size = os.path.getsize(path)
+        if size <= HEADER.size:
+            return []
+
+        with mmap.mmap(journal_file.fileno(), 0, access = mmap.ACCESS_READ) as mapped:
+            magic, version = HEADER.unpack_from(mapped)
+            if magic != MAGIC or version != VERSION:
+                _LOGGER.warning("Skipping %s, not a version %d journal", path, VERSION)
+                return []
+
+            end = size - (size - HEADER.size) % RECORD.size
+            with memoryview(mapped)[HEADER.size:end] as records:
+                return list(RECORD.iter_unpack(records))
+
+# All records in the directory at or after since, oldest file first. The
+# meter index is replaced by the meter mac and the type by the reading name.
+def read_journal(directory, since = None):
+    meters = read_meters(directory)
+    for path in journal_files(directory):
+        for timestamp, index, reading, value in read_file(path):
+            if since is not None and timestamp < since:
+                continue
+            if index >= len(meters) or reading >= len(READINGS):
+                continue
+            yield timestamp, meters[index], READINGS[reading], value
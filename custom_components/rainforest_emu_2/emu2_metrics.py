@@ -0,0 +1,111 @@
+from bisect import bisect_left
+
+# Upper bounds, in seconds, of the histogram buckets. The last bucket
+# holds everything slower.
+BUCKETS = (
+    0.00001, 0.00002, 0.00005,
+    0.0001, 0.0002, 0.0005,
+    0.001, 0.002, 0.005,
+    0.01, 0.02, 0.05,
+    0.1, 0.2, 0.5,
+    1.0, 2.0, 5.0,
+    10.0,
+)
+
+# Counts of observed durations in fixed buckets, so an observation is a
+# bisect and a few additions whatever the number of observations.
+class Histogram:
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        if not self.count:
+            return None
+        return self.total / self.count
+
+    # Upper bound of the bucket holding the given fraction of observations
+    def percentile(self, fraction: float):
+        if not self.count:
+            return None
+
+        target = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return BUCKETS[index] if index < len(BUCKETS) else self.max
+        return self.max
+
+    def merge(self, other) -> None:
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "p50": self.percentile(0.50),
+            "p99": self.percentile(0.99),
+            "max": self.max,
+        }
+
+# Counters and timings for the read loop and the command queue of an Emu2.
+#
+# Emu2 only keeps a Metrics when they are enabled, and checks for None
+# before recording anything, so there is no cost beyond that check when
+# they are disabled.
+class Metrics:
+    def __init__(self):
+        self.bytes_read = 0
+        self.frames = 0
+        self.parse_failures = 0
+        self.decode_errors = 0
+        self.unknown_frames = 0
+        self.skipped_frames = 0
+        self.commands_written = 0
+        self.reconnects = 0
+        self.failed_opens = 0
+
+        self.decode_time = Histogram()
+        self.fanout_time = Histogram()
+        self.queue_wait = Histogram()
+
+    # Add the counts of other into these
+    def merge(self, other) -> None:
+        for name, value in vars(other).items():
+            if isinstance(value, Histogram):
+                getattr(self, name).merge(value)
+            else:
+                setattr(self, name, getattr(self, name) + value)
+
+    def as_dict(self) -> dict:
+        return {
+            "bytes_read": self.bytes_read,
+            "frames": self.frames,
+            "parse_failures": self.parse_failures,
+            "decode_errors": self.decode_errors,
+            "unknown_frames": self.unknown_frames,
+            "skipped_frames": self.skipped_frames,
+            "commands_written": self.commands_written,
+            "reconnects": self.reconnects,
+            "failed_opens": self.failed_opens,
+            "decode_time": self.decode_time.as_dict(),
+            "fanout_time": self.fanout_time.as_dict(),
+            "queue_wait": self.queue_wait.as_dict(),
+        }
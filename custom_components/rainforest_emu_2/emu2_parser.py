@@ -0,0 +1,129 @@
+import logging
+import re
+from xml.etree import ElementTree
+
+_LOGGER = logging.getLogger(__name__)
+
+# Longest frame, in bytes, before an opening tag without a closing tag is
+# treated as garbage. Frames from the device are a few hundred bytes.
+MAX_FRAME_BYTES = 4096
+
+# The opening tag of a frame, and its name
+_OPEN_TAG = re.compile(rb'<([A-Za-z_][\w.:-]*)[^<>]*>')
+
+# Incremental parser for the stream of XML fragments sent by the device.
+#
+# The EMU-2 writes a sequence of top level elements with no enclosing
+# document. Bytes are collected in a buffer as they arrive, and a frame is
+# cut out as soon as the closing tag matching its opening tag is in the
+# buffer. Only that slice of the buffer is handed to the XML parser, which
+# parses it as a child of a synthetic root element.
+#
+# A slice that isn't a single well formed element, such as the tail end of
+# a frame that was cut off when the connection opened, is dropped up to
+# the next opening tag, so a well formed frame that follows is not lost.
+#
+# With a scanner, see emu2_scanner, the frames it accepts are returned as
+# a Fragment rather than an element, without going through the XML parser.
+class FrameParser:
+    def __init__(self, scanner = None):
+        self._buffer = bytearray()
+        self._scanner = scanner
+        self._reset()
+
+        # Number of times malformed or unterminated XML was dropped
+        self.failures = 0
+
+    def _reset(self):
+        self._parser = ElementTree.XMLPullParser(events=('start', 'end'))
+        self._parser.feed(b'<Root>')
+        _, self._root = next(self._parser.read_events())
+
+    # Feed raw bytes from the device, returns the list of completed
+    # top level elements, and fragments from the scanner.
+    def feed(self, data) -> list:
+        buffer = self._buffer
+        buffer += data
+        frames = []
+        scanner = self._scanner
+
+        position = 0
+        while True:
+            match = _OPEN_TAG.search(buffer, position)
+            if match is None:
+                # Keep what may be the start of an opening tag
+                start = buffer.rfind(b'<', position)
+                if start < 0 or len(buffer) - start > MAX_FRAME_BYTES:
+                    start = len(buffer)
+                position = start
+                break
+
+            start = match.start()
+            tag = match.group(1)
+            frame = None
+            if buffer[match.end() - 2] == 0x2f:
+                # <Tag/>
+                end = match.end()
+            else:
+                close = buffer.find(b'</%s>' % tag, match.end())
+                if close < 0:
+                    if len(buffer) - start > MAX_FRAME_BYTES:
+                        # An opening tag that is never closed would
+                        # otherwise hold up every frame that follows it.
+                        self._drop(buffer, start, "Unterminated XML")
+                        position = start + 1
+                        continue
+                    position = start
+                    break
+                end = close + len(tag) + 3
+
+                # Only <Tag> with nothing else in the opening tag
+                if scanner is not None and match.end() - start == len(tag) + 2:
+                    frame = scanner.scan(tag, buffer, match.end(), close)
+
+            if frame is None:
+                frame = self._parse(buffer, start, end)
+            if frame is None:
+                position = start + 1
+                continue
+
+            frames.append(frame)
+            position = end
+
+        # Frames are cut out of the buffer in one go
+        del buffer[:position]
+        return frames
+
+    # Parse buffer[start:end], returning the element or None if it is not
+    # a single well formed element.
+    def _parse(self, buffer, start, end):
+        frame = None
+        depth = 0
+        try:
+            with memoryview(buffer)[start:end] as data:
+                self._parser.feed(data)
+
+            for event, elem in self._parser.read_events():
+                if event == 'start':
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 0:
+                        frame = elem
+        except ElementTree.ParseError as ex:
+            self._drop(buffer, start, f"Malformed XML ({ex})")
+            self._reset()
+            return None
+
+        if depth != 0 or frame is None:
+            self._drop(buffer, start, "Malformed XML")
+            self._reset()
+            return None
+
+        self._root.clear()
+        return frame
+
+    def _drop(self, buffer, start, reason):
+        self.failures += 1
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            _LOGGER.debug("%s, dropping: %s", reason, bytes(buffer[start:start + 64]))
@@ -0,0 +1,71 @@
+import re
+
+from .emu2_entities import Entity
+
+# The notifications which make up almost all of the traffic from the
+# device. Each is a flat list of fields holding only text.
+SCANNED_TAGS = ('InstantaneousDemand', 'CurrentSummationDelivered', 'PriceCluster')
+
+# A field, <Name>text</Name>, and the whitespace before it. The text is
+# limited to characters the XML parser returns unchanged, so there are no
+# entity or character references, CDATA sections or carriage returns, all
+# of which the XML parser would rewrite.
+_FIELD = re.compile(rb'([ \t\r\n]*)<([A-Za-z_][\w.-]*)>([^<>&\r\x00-\x08\x0b\x0c\x0e-\x1f\x7f-\xff]*)</\2>')
+
+# Text of the fields of a scanned frame, keyed by tag. Built in place of
+# an element, see Entity.from_fields.
+class Fragment:
+    __slots__ = ("tag", "fields")
+
+    def __init__(self, tag, fields):
+        self.tag = tag
+        self.fields = fields
+
+# Decodes the frames of SCANNED_TAGS with a regular expression instead of
+# the XML parser, for FrameParser.
+#
+# A frame is only scanned when it is exactly the opening tag, then fields
+# of the entity class with nothing in them but plain text, then the
+# closing tag. Anything else, such as an attribute, a nested element, a
+# field the class does not know or text with a reference in it, returns
+# None so that the frame goes to the XML parser, which gives the same
+# result for every frame the scanner accepts.
+class Scanner:
+    def __init__(self, tags = SCANNED_TAGS):
+        # The tag and field tags by frame tag, as bytes to match against
+        # the buffer
+        self._fields = {}
+        for tag in tags:
+            klass = Entity.tag_to_class(tag)
+            names = {name.encode(): name for name in klass.field_tags()}
+            self._fields[tag.encode()] = (tag, names)
+
+    # Scan the fields of a frame tagged tag, which are in buffer[start:end]
+    # between the opening and closing tags. Returns a Fragment, or None if
+    # the frame needs the XML parser.
+    def scan(self, tag, buffer, start, end):
+        spec = self._fields.get(tag)
+        if spec is None:
+            return None
+        tag, names = spec
+
+        # The fields must follow each other with nothing in between, which
+        # is checked by adding up the length of each match, as findall
+        # skips anything that doesn't match.
+        length = 0
+        fields = {}
+        for space, name, text in _FIELD.findall(buffer, start, end):
+            length += len(space) + 2 * len(name) + len(text) + 5
+            name = names.get(name)
+            if name is None:
+                return None
+
+            # Only the first occurrence of a tag is used, and an empty
+            # element has no text
+            if name not in fields:
+                fields[name] = text.decode('ascii') if text else None
+
+        if length != end - start and buffer[start + length:end].strip(b' \t\r\n'):
+            return None
+
+        return Fragment(tag, fields)
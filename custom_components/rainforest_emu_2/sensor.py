@@ -1,7 +1,11 @@
 """Support for Rainforest EMU-2."""
 from __future__ import annotations
 
+import time
+
 from homeassistant.core import callback
+from homeassistant.helpers.event import async_call_later
+from homeassistant.util import dt
 from homeassistant.components.sensor import (
     SensorEntity,
     SensorStateClass,
@@ -17,32 +21,177 @@ from homeassistant.const import (
     ENERGY_KILO_WATT_HOUR,
     POWER_KILO_WATT,
     CURRENCY_DOLLAR,
+    TIME_MILLISECONDS,
 )
-
-from .const import DOMAIN, DEVICE_NAME
+from homeassistant.helpers.entity import EntityCategory
+
+from .const import (
+    DOMAIN,
+    DEVICE_NAME,
+    CONF_POWER_DEADBAND,
+    CONF_POWER_DEADBAND_PERCENT,
+    CONF_MIN_WRITE_INTERVAL,
+    CONF_MAX_WRITE_AGE,
+    DEFAULT_POWER_DEADBAND,
+    DEFAULT_POWER_DEADBAND_PERCENT,
+    DEFAULT_MIN_WRITE_INTERVAL,
+    DEFAULT_MAX_WRITE_AGE,
+)
+from .emu2_history import WINDOWS
 
 # Only allow a single update at a time as they all go through the same serial interface
 PARALLEL_UPDATES = 1
 
+# Seconds between state writes of the windowed power sensors, whose
+# attributes change with every reading
+WINDOW_WRITE_INTERVAL = 30
+
 async def async_setup_entry(hass, config_entry, async_add_entities):
     device = hass.data[DOMAIN][config_entry.entry_id]
 
-    entities = [
-        Emu2ActivePowerSensor(device),
-        Emu2CurrentPriceSensor(device),
-        Emu2CurrentPeriodUsageSensor(device),
-        Emu2SummationDeliveredSensor(device),
-        Emu2SummationReceivedSensor(device),
+    options = config_entry.options
+
+    def power_policy():
+        return WritePolicy(
+            deadband = options.get(CONF_POWER_DEADBAND, DEFAULT_POWER_DEADBAND),
+            deadband_percent = options.get(CONF_POWER_DEADBAND_PERCENT, DEFAULT_POWER_DEADBAND_PERCENT),
+            min_interval = options.get(CONF_MIN_WRITE_INTERVAL, DEFAULT_MIN_WRITE_INTERVAL),
+            max_age = options.get(CONF_MAX_WRITE_AGE, DEFAULT_MAX_WRITE_AGE),
+        )
+
+    # The sensors without a meter follow the primary meter, sensors are
+    # added for any other meter as it is discovered.
+    async_add_entities(_meter_sensors(device, None, power_policy()))
+
+    def add_meter(meter_mac):
+        async_add_entities(_meter_sensors(device, meter_mac, power_policy()))
+
+    device.register_meter_listener(add_meter)
+
+    if device.metrics is not None:
+        async_add_entities(
+            Emu2MetricSensor(device, key, name, value, unit)
+            for key, name, value, unit in METRIC_SENSORS
+        )
+
+
+def _meter_sensors(device, meter_mac, power_policy):
+    return [
+        Emu2ActivePowerSensor(device, meter_mac, power_policy),
+        Emu2CurrentPriceSensor(device, meter_mac),
+        Emu2CurrentPeriodUsageSensor(device, meter_mac),
+        Emu2SummationDeliveredSensor(device, meter_mac),
+        Emu2SummationReceivedSensor(device, meter_mac),
+    ] + [
+        Emu2PowerWindowSensor(device, meter_mac, span) for span in WINDOWS
     ]
-    async_add_entities(entities)
 
 
+# Diagnostic sensors shown when metrics are enabled, as (key, name, value
+# from the Metrics, unit). Timings are shown in milliseconds.
+def _p99_ms(histogram):
+    p99 = histogram.percentile(0.99)
+    return None if p99 is None else round(p99 * 1000, 3)
+
+METRIC_SENSORS = (
+    ("frames", "Frames Received", lambda metrics: metrics.frames, None),
+    ("parse_failures", "Parse Failures", lambda metrics: metrics.parse_failures, None),
+    ("reconnects", "Reconnects", lambda metrics: metrics.reconnects, None),
+    ("decode_time_p99", "Decode Time p99", lambda metrics: _p99_ms(metrics.decode_time), TIME_MILLISECONDS),
+    ("fanout_time_p99", "Update Time p99", lambda metrics: _p99_ms(metrics.fanout_time), TIME_MILLISECONDS),
+    ("queue_wait_p99", "Command Wait p99", lambda metrics: _p99_ms(metrics.queue_wait), TIME_MILLISECONDS),
+)
+
+
+class WritePolicy:
+    """Decide which updates of a sensor are written to the state.
+
+    An update is skipped when it is within the deadband of the last written
+    value, which is the larger of deadband and deadband_percent of that
+    value, or when it arrives less than min_interval seconds after the last
+    write. Skipped updates are written anyway once the last write is
+    max_age seconds old. Zero disables each of them.
+
+    written counts the writes, and suppressed the updates which were not
+    written when they arrived, including those written later on a retry.
+    """
+
+    def __init__(self, deadband = 0.0, deadband_percent = 0.0, min_interval = 0.0, max_age = 0.0):
+        self.deadband = deadband
+        self.deadband_percent = deadband_percent
+        self.min_interval = min_interval
+        self.max_age = max_age
+
+        self.written = 0
+        self.suppressed = 0
+        self._last_value = None
+        self._last_write = None
+
+    def should_write(self, value, now: float, retry: bool = False) -> bool:
+        """Whether to write value. A retry of a skipped update is not counted again when skipped."""
+        if self._last_write is not None:
+            age = now - self._last_write
+            if not self.max_age or age < self.max_age:
+                if age < self.min_interval or self._within_deadband(value):
+                    if not retry:
+                        self.suppressed += 1
+                    return False
+
+        self.written += 1
+        self._last_value = value
+        self._last_write = now
+        return True
+
+    def retry_after(self, now: float) -> float:
+        """Seconds until a skipped update can be written, or None if it is within the deadband."""
+        if self._last_write is None:
+            return None
+        remaining = self.min_interval - (now - self._last_write)
+        return remaining if remaining > 0 else None
+
+    def _within_deadband(self, value) -> bool:
+        last = self._last_value
+        if value is None or last is None:
+            return value == last
+
+        threshold = max(self.deadband, abs(last) * self.deadband_percent / 100)
+        return abs(value - last) <= threshold
+
+    def as_dict(self) -> dict:
+        return {
+            "deadband": self.deadband,
+            "deadband_percent": self.deadband_percent,
+            "min_interval": self.min_interval,
+            "max_age": self.max_age,
+            "written": self.written,
+            "suppressed": self.suppressed,
+        }
+
+
+# All readings are pushed by the device, see FALLBACK_POLLS for the
+# readings that are requested when they stop arriving.
 class SensorEntityBase(SensorEntity):
-    should_poll = True
+    should_poll = False
 
-    def __init__(self, device, observe):
+    # Response attributes which the state depends on, updates which don't
+    # change any of them don't write the state. Not used with a write
+    # policy, which needs to see every update to write after max_age.
+    _changed = None
+
+    def __init__(self, device, observe, meter_mac, key, name, write_policy = None):
         self._device = device
         self._observe = observe
+        self._meter_mac = meter_mac
+        self._key = key
+        self._write_policy = write_policy
+        self._cancel_deferred_write = None
+
+        if meter_mac is None:
+            self._attr_unique_id = f"{self._device.device_id}_{key}"
+            self._attr_name = f"{self._device.device_name} {name}"
+        else:
+            self._attr_unique_id = f"{self._device.device_id}_{meter_mac}_{key}"
+            self._attr_name = f"{self._device.device_name} {meter_mac} {name}"
 
     @property
     def device_info(self):
@@ -60,20 +209,98 @@ class SensorEntityBase(SensorEntity):
         return self._device.connected
 
     async def async_added_to_hass(self):
-        self._device.register_callback(self._observe, self.async_write_ha_state)
+        changed = self._changed if self._write_policy is None else None
+        self.async_on_remove(
+            self._device.register_callback(
+                self._observe, self._async_handle_update, self._meter_mac, changed
+            )
+        )
+        self.async_on_remove(self._async_cancel_deferred_write)
+        # Availability follows the connection
+        self.async_on_remove(self._device.register_connection_listener(self.async_write_ha_state))
+        if self._write_policy is not None:
+            self.async_on_remove(
+                self._device.register_write_policy(self._key, self._meter_mac, self._write_policy)
+            )
+
+    @callback
+    def _async_handle_update(self, retry = False):
+        policy = self._write_policy
+        if policy is None:
+            self.async_write_ha_state()
+            return
+
+        now = time.monotonic()
+        if policy.should_write(self.state, now, retry):
+            self._async_cancel_deferred_write()
+            self.async_write_ha_state()
+            return
+
+        # Make sure the latest value is written once the interval has passed
+        delay = policy.retry_after(now)
+        if delay is not None and self._cancel_deferred_write is None:
+            self._cancel_deferred_write = async_call_later(self.hass, delay, self._async_deferred_write)
+
+    @callback
+    def _async_deferred_write(self, _now):
+        self._cancel_deferred_write = None
+        self._async_handle_update(retry = True)
+
+    @callback
+    def _async_cancel_deferred_write(self):
+        if self._cancel_deferred_write is not None:
+            self._cancel_deferred_write()
+            self._cancel_deferred_write = None
 
-    async def async_will_remove_from_hass(self):
-        self._device.remove_callback(self._observe, self.async_write_ha_state)
+    @property
+    def write_policy(self) -> WritePolicy:
+        return self._write_policy
+
+    def _meter_value(self, name):
+        meter = self._device.meter(self._meter_mac)
+        if meter is None:
+            return None
+        return getattr(meter, name)
+
+    def _meter_history(self, name):
+        meter = self._device.meter(self._meter_mac)
+        if meter is None:
+            return None
+        return meter.history[name]
 
 
 class Emu2ActivePowerSensor(SensorEntityBase):
-    should_poll = False
+    _changed = ("reading",)
 
-    def __init__(self, device):
-        super().__init__(device, "InstantaneousDemand")
+    def __init__(self, device, meter_mac, write_policy):
+        super().__init__(device, "InstantaneousDemand", meter_mac, "power", "Power", write_policy)
 
-        self._attr_unique_id = f"{self._device.device_id}_power"
-        self._attr_name = f"{self._device.device_name} Power"
+        self._attr_device_class = SensorDeviceClass.POWER
+        self._attr_state_class = SensorStateClass.MEASUREMENT
+        self._attr_native_unit_of_measurement = POWER_KILO_WATT
+
+    @property
+    def state(self):
+        return self._meter_value("power")
+
+
+class Emu2PowerWindowSensor(SensorEntityBase):
+    """Average power over the last few minutes, with the minimum, maximum and rate of change as attributes.
+
+    These come from the readings kept in memory, so short windows can be
+    shown without querying the recorder history. The state is written at
+    most every WINDOW_WRITE_INTERVAL seconds, and the attributes are not
+    recorded.
+    """
+    _unrecorded_attributes = frozenset({"min", "max", "rate_of_change", "readings"})
+
+    def __init__(self, device, meter_mac, span):
+        minutes = span // 60
+        super().__init__(
+            device, "InstantaneousDemand", meter_mac, f"power_mean_{minutes}m", f"Power Average {minutes} min",
+            WritePolicy(min_interval = WINDOW_WRITE_INTERVAL)
+        )
+        self._span = span
 
         self._attr_device_class = SensorDeviceClass.POWER
         self._attr_state_class = SensorStateClass.MEASUREMENT
@@ -81,15 +308,37 @@ class Emu2ActivePowerSensor(SensorEntityBase):
 
     @property
     def state(self):
-        return self._device.power
+        history = self._meter_history("power")
+        if history is None:
+            return None
+
+        mean = history.mean(self._span, time.monotonic())
+        if mean is None:
+            return None
+        return round(mean, 3)
+
+    @property
+    def extra_state_attributes(self):
+        history = self._meter_history("power")
+        if history is None:
+            return None
+
+        stats = history.stats(self._span, time.monotonic())
+        rate = stats["rate"]
+        return {
+            "min": stats["min"],
+            "max": stats["max"],
+            # kW per minute
+            "rate_of_change": None if rate is None else round(rate * 60, 3),
+            "readings": stats["count"],
+        }
 
 
 class Emu2CurrentPriceSensor(SensorEntityBase):
-    def __init__(self, device):
-        super().__init__(device, "PriceCluster")
+    _changed = ("price_dollars",)
 
-        self._attr_unique_id = f"{self._device.device_id}_current_price"
-        self._attr_name = f"{self._device.device_name} Current Price"
+    def __init__(self, device, meter_mac):
+        super().__init__(device, "PriceCluster", meter_mac, "current_price", "Current Price")
 
         self._attr_device_class = SensorDeviceClass.MONETARY
         self._attr_state_class = SensorStateClass.MEASUREMENT
@@ -97,45 +346,38 @@ class Emu2CurrentPriceSensor(SensorEntityBase):
             f"{CURRENCY_DOLLAR}/{ENERGY_KILO_WATT_HOUR}"
         )
 
-    async def async_update(self):
-        await self._device._emu2.get_current_price()
-
     @property
     def state(self):
-        return self._device.current_price
+        return self._meter_value("current_price")
 
 
 class Emu2CurrentPeriodUsageSensor(SensorEntityBase):
-    def __init__(self, device):
-        super().__init__(device, "CurrentPeriodUsage")
+    _changed = ("reading", "start_date")
 
-        self._attr_unique_id = f"{self._device.device_id}_current_period_usage"
-        self._attr_name = f"{self._device.device_name} Current Period Usage"
+    def __init__(self, device, meter_mac):
+        super().__init__(device, "CurrentPeriodUsage", meter_mac, "current_period_usage", "Current Period Usage")
 
         self._attr_device_class = SensorDeviceClass.ENERGY
         self._attr_state_class = SensorStateClass.TOTAL
         self._attr_native_unit_of_measurement = ENERGY_KILO_WATT_HOUR
 
-    async def async_update(self):
-        await self._device._emu2.get_current_period_usage()
-
     @property
     def state(self):
-        return self._device.current_usage
+        return self._meter_value("current_usage")
 
     @property
     def last_reset(self):
-        return self._device.current_usage_start_date
+        start_date = self._meter_value("current_usage_start_date")
+        if start_date is None:
+            return dt.utc_from_timestamp(0)
+        return start_date
 
 
 class Emu2SummationDeliveredSensor(SensorEntityBase):
-    should_poll = False
+    _changed = ("delivered",)
 
-    def __init__(self, device):
-        super().__init__(device, "CurrentSummationDelivered")
-
-        self._attr_unique_id = f"{self._device.device_id}_summation_delivered"
-        self._attr_name = f"{self._device.device_name} Summation Delivered"
+    def __init__(self, device, meter_mac):
+        super().__init__(device, "CurrentSummationDelivered", meter_mac, "summation_delivered", "Summation Delivered")
 
         self._attr_device_class = SensorDeviceClass.ENERGY
         self._attr_state_class = SensorStateClass.TOTAL_INCREASING
@@ -143,18 +385,15 @@ class Emu2SummationDeliveredSensor(SensorEntityBase):
 
     @property
     def state(self):
-        return self._device.summation_delivered
+        return self._meter_value("summation_delivered")
 
 
 class Emu2SummationReceivedSensor(SensorEntityBase):
-    should_poll = False
+    _changed = ("received",)
 
-    def __init__(self, device):
+    def __init__(self, device, meter_mac):
         # The received information is part of the Summation Delivered XML packet
-        super().__init__(device, "CurrentSummationDelivered")
-
-        self._attr_unique_id = f"{self._device.device_id}_summation_received"
-        self._attr_name = f"{self._device.device_name} Summation Received"
+        super().__init__(device, "CurrentSummationDelivered", meter_mac, "summation_received", "Summation Received")
 
         self._attr_device_class = SensorDeviceClass.ENERGY
         self._attr_state_class = SensorStateClass.TOTAL_INCREASING
@@ -162,4 +401,32 @@ class Emu2SummationReceivedSensor(SensorEntityBase):
 
     @property
     def state(self):
-        return self._device.summation_received
+        return self._meter_value("summation_received")
+
+
+class Emu2MetricSensor(SensorEntityBase):
+    """A counter or timing of the connection, read every scan interval."""
+    should_poll = True
+
+    def __init__(self, device, key, name, value, unit):
+        super().__init__(device, None, None, f"metrics_{key}", name)
+        self._value = value
+
+        self._attr_entity_category = EntityCategory.DIAGNOSTIC
+        self._attr_native_unit_of_measurement = unit
+        if unit is None:
+            self._attr_state_class = SensorStateClass.TOTAL_INCREASING
+        else:
+            self._attr_state_class = SensorStateClass.MEASUREMENT
+
+    @property
+    def available(self) -> bool:
+        return self._device.metrics is not None
+
+    async def async_added_to_hass(self):
+        # Polled rather than updated with each frame
+        return
+
+    @property
+    def state(self):
+        return self._value(self._device.metrics)
@@ -0,0 +1,184 @@
+"""Backfill long-term statistics from the meter interval data and the reading journal."""
+from __future__ import annotations
+
+import datetime
+import logging
+
+from homeassistant.core import HomeAssistant
+from homeassistant.components.recorder import get_instance
+from homeassistant.components.recorder.models import StatisticData, StatisticMetaData
+from homeassistant.components.recorder.statistics import (
+    async_add_external_statistics,
+    get_last_statistics,
+)
+from homeassistant.const import ENERGY_KILO_WATT_HOUR
+from homeassistant.util import dt
+
+from .const import DOMAIN, DEVICE_NAME
+from .emu2_entities import PROFILE_INVALID_INTERVAL
+from .emu2_journal import read_journal
+
+_LOGGER = logging.getLogger(__name__)
+
+# Rainforest times are seconds since 2000-01-01 UTC
+RAINFOREST_EPOCH = 946684800
+
+# Statistics are kept per hour
+HOUR = 3600
+
+# Each request returns at most 12 intervals, this bounds how far back a
+# single backfill reaches.
+MAX_PROFILE_REQUESTS = 8
+
+def statistic_id(meter_mac: str, channel: str) -> str:
+    """Return the external statistic id for a meter channel."""
+    return f"{DOMAIN}:{meter_mac}_{channel}".lower()
+
+async def async_backfill_profile(hass: HomeAssistant, device, meter_mac: str, channel: str) -> int:
+    """Import the hours since the last imported statistic from the meter interval data.
+
+    The intervals are summed into whole hours, and every new hour is added
+    in a single write. Returns the number of hours imported.
+    """
+    meter = device.meter(meter_mac)
+    scale = meter.summation_scale if meter is not None else None
+    if scale is None:
+        _LOGGER.debug("No summation format for %s yet, skipping backfill", meter_mac)
+        return 0
+
+    last_start, total = await _async_last_statistic(hass, meter_mac, channel)
+
+    intervals, interval_seconds = await _async_read_intervals(device, meter_mac, channel, last_start)
+    if not intervals:
+        return 0
+
+    # Only hours that are fully covered by valid intervals are imported
+    per_hour = HOUR // interval_seconds
+    hours = {}
+    for start, value in intervals.items():
+        hour = start - start % HOUR
+        if last_start is not None and hour <= last_start:
+            continue
+        hours.setdefault(hour, []).append(value)
+
+    usage = {
+        hour: sum(values) * scale
+        for hour, values in hours.items()
+        if len(values) == per_hour and PROFILE_INVALID_INTERVAL not in values
+    }
+    return _add_hours(hass, meter_mac, channel, total, usage)
+
+async def async_replay_journal(hass: HomeAssistant, directory: str) -> int:
+    """Import the hours since the last imported statistic from the summations in the journal.
+
+    The usage of an hour is the difference between the last summation
+    journaled in it and in the hour before. Returns the number of hours
+    imported.
+    """
+    instance = get_instance(hass)
+    summations = await instance.async_add_executor_job(_hourly_summations, directory)
+
+    # The current hour is not over yet
+    current_hour = dt.utcnow().timestamp() // HOUR * HOUR
+
+    imported = 0
+    for (meter_mac, channel), last_values in summations.items():
+        last_start, total = await _async_last_statistic(hass, meter_mac, channel)
+
+        usage = {}
+        for hour, value in last_values.items():
+            if hour >= current_hour or (last_start is not None and hour <= last_start):
+                continue
+            previous = last_values.get(hour - HOUR)
+            if previous is not None and value >= previous:
+                usage[hour] = value - previous
+
+        imported += _add_hours(hass, meter_mac, channel, total, usage)
+    return imported
+
+def _hourly_summations(directory):
+    """The last summation journaled in each hour, keyed by (meter mac, channel). Blocking."""
+    channels = {'summation_delivered': 'delivered', 'summation_received': 'received'}
+
+    summations = {}
+    for timestamp, meter_mac, reading, value in read_journal(directory):
+        channel = channels.get(reading)
+        if channel is not None:
+            hour = int(timestamp) - int(timestamp) % HOUR
+            summations.setdefault((meter_mac, channel), {})[hour] = value
+    return summations
+
+async def _async_last_statistic(hass, meter_mac, channel):
+    """The start time and sum of the last imported hour, or None and 0."""
+    stat_id = statistic_id(meter_mac, channel)
+    last = await get_instance(hass).async_add_executor_job(
+        get_last_statistics, hass, 1, stat_id, True, {"sum"}
+    )
+    if not last.get(stat_id):
+        return None, 0.0
+
+    row = last[stat_id][0]
+    last_start = row["start"]
+    if isinstance(last_start, datetime.datetime):
+        last_start = last_start.timestamp()
+    return last_start, row["sum"] or 0.0
+
+def _add_hours(hass, meter_mac, channel, total, usage) -> int:
+    """Add the usage of each hour after the last imported one in a single write."""
+    statistics = []
+    for hour in sorted(usage):
+        value = round(usage[hour], 6)
+        total = round(total + value, 6)
+        statistics.append(
+            StatisticData(start = dt.utc_from_timestamp(hour), state = value, sum = total)
+        )
+
+    if not statistics:
+        return 0
+
+    metadata = StatisticMetaData(
+        has_mean = False,
+        has_sum = True,
+        name = f"{DEVICE_NAME} {meter_mac} Interval {channel.capitalize()}",
+        source = DOMAIN,
+        statistic_id = statistic_id(meter_mac, channel),
+        unit_of_measurement = ENERGY_KILO_WATT_HOUR,
+    )
+    async_add_external_statistics(hass, metadata, statistics)
+
+    _LOGGER.debug("Imported %d hours of %s usage for %s", len(statistics), channel, meter_mac)
+    return len(statistics)
+
+async def _async_read_intervals(device, meter_mac, channel, since):
+    """Request interval data, working back from the latest, until since is covered.
+
+    Returns a dict of interval start time to raw value, and the interval
+    length in seconds.
+    """
+    intervals = {}
+    interval_seconds = None
+    end_time = 0
+
+    for _ in range(MAX_PROFILE_REQUESTS):
+        response = await device.async_request_profile_data(meter_mac, end_time, channel)
+        if response is None or response.status != 0 or not response.intervals:
+            break
+
+        seconds = response.interval_seconds
+        if seconds is None or seconds > HOUR or HOUR % seconds:
+            _LOGGER.debug("Interval period %s can't be summed into hours", response.period_interval)
+            break
+        if interval_seconds not in (None, seconds):
+            break
+        interval_seconds = seconds
+
+        end = response.end_time + RAINFOREST_EPOCH
+        for index, value in enumerate(response.intervals):
+            intervals[end - (index + 1) * seconds] = value
+
+        oldest = end - len(response.intervals) * seconds
+        if since is not None and oldest <= since + HOUR:
+            break
+        end_time = oldest - RAINFOREST_EPOCH
+
+    return intervals, interval_seconds
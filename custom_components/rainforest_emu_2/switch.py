@@ -0,0 +1,99 @@
+"""Support for Rainforest EMU-2 high resolution demand."""
+from __future__ import annotations
+
+import voluptuous as vol
+
+from homeassistant.core import callback
+from homeassistant.components.switch import SwitchEntity
+from homeassistant.helpers import entity_platform
+from homeassistant.const import (
+    ATTR_IDENTIFIERS,
+    ATTR_NAME,
+    ATTR_MANUFACTURER,
+    ATTR_MODEL,
+    ATTR_HW_VERSION,
+    ATTR_SW_VERSION,
+)
+
+from .const import DOMAIN, DEVICE_NAME
+
+SERVICE_ENABLE_FAST_POLL = "enable_fast_poll"
+ATTR_FREQUENCY = "frequency"
+
+async def async_setup_entry(hass, config_entry, async_add_entities):
+    device = hass.data[DOMAIN][config_entry.entry_id]
+
+    async_add_entities([Emu2FastPollSwitch(device)])
+
+    platform = entity_platform.async_get_current_platform()
+    platform.async_register_entity_service(
+        SERVICE_ENABLE_FAST_POLL,
+        {
+            vol.Optional(ATTR_FREQUENCY): vol.All(vol.Coerce(int), vol.Range(min = 1, max = 255)),
+        },
+        "async_enable_fast_poll",
+    )
+
+
+class Emu2FastPollSwitch(SwitchEntity):
+    """Ask the device for InstantaneousDemand every few seconds, renewing the request until turned off."""
+    should_poll = False
+
+    def __init__(self, device):
+        self._device = device
+
+        self._attr_unique_id = f"{self._device.device_id}_fast_poll"
+        self._attr_name = f"{self._device.device_name} High Resolution Demand"
+        self._attr_icon = "mdi:timer-outline"
+
+    @property
+    def device_info(self):
+        return {
+            ATTR_IDENTIFIERS: {(DOMAIN, self._device.device_id)},
+            ATTR_NAME: DEVICE_NAME,
+            ATTR_MANUFACTURER: self._device.device_manufacturer,
+            ATTR_MODEL: self._device.device_model,
+            ATTR_HW_VERSION: self._device.device_hw_version,
+            ATTR_SW_VERSION: self._device.device_sw_version,
+        }
+
+    @property
+    def available(self) -> bool:
+        return self._device.connected
+
+    @property
+    def is_on(self) -> bool:
+        return self._device.fast_poll
+
+    @property
+    def extra_state_attributes(self):
+        return {
+            ATTR_FREQUENCY: self._device.fast_poll_frequency,
+            "late_readings": self._device.fast_poll_late,
+            "dropped_readings": self._device.fast_poll_dropped,
+        }
+
+    async def async_added_to_hass(self):
+        self.async_on_remove(
+            self._device.register_callback("InstantaneousDemand", self._async_handle_demand)
+        )
+        # Availability follows the connection
+        self.async_on_remove(self._device.register_connection_listener(self.async_write_ha_state))
+
+    @callback
+    def _async_handle_demand(self):
+        # Keep the late and dropped counts current while turned on
+        if self._device.fast_poll:
+            self.async_write_ha_state()
+
+    async def async_turn_on(self, **kwargs) -> None:
+        await self._device.async_set_fast_poll(True)
+        self.async_write_ha_state()
+
+    async def async_turn_off(self, **kwargs) -> None:
+        await self._device.async_set_fast_poll(False)
+        self.async_write_ha_state()
+
+    async def async_enable_fast_poll(self, frequency = None) -> None:
+        await self._device.async_set_fast_poll(True, frequency)
+        self.async_write_ha_state()
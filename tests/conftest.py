@@ -0,0 +1,27 @@
+"""Import the emu2 modules of the integration without Home Assistant.
+
+The package __init__ sets up the Home Assistant integration, so the
+package is created empty and only the emu2 modules are imported, as
+tools/emu2_benchmark.py does.
+"""
+import os
+import sys
+import types
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = os.path.join(ROOT, "custom_components", "rainforest_emu_2")
+
+if "rainforest_emu_2" not in sys.modules:
+    package = types.ModuleType("rainforest_emu_2")
+    package.__path__ = [PACKAGE]
+    sys.modules["rainforest_emu_2"] = package
+
+
+@pytest.fixture
+def emu():
+    from rainforest_emu_2 import emu2, emu2_batch, emu2_entities, emu2_parser, emu2_scanner
+    return types.SimpleNamespace(
+        emu2=emu2, batch=emu2_batch, entities=emu2_entities, parser=emu2_parser, scanner=emu2_scanner
+    )
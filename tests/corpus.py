@@ -0,0 +1,85 @@
+"""Randomized corpus of notifications, including malformed and unusual frames."""
+import random
+
+
+def random_text(rng: random.Random) -> str:
+    """Field text, mostly hex numbers as sent by the device."""
+    choice = rng.random()
+    if choice < 0.6:
+        return "0x{:0{}x}".format(rng.getrandbits(rng.choice((8, 16, 24, 32, 64))), rng.choice((2, 4, 6, 8, 16)))
+    if choice < 0.7:
+        return rng.choice(("0x00000000", "0xffffffff", "0x80000000", "0x7fffffff", "0X1A", "Y", "N"))
+    if choice < 0.8:
+        return rng.choice(("", " ", " 0x10 ", "Set by User", "12", "0x", "zz", "-0x5"))
+    return "".join(rng.choice("0123456789abcdefx YN-._:") for _ in range(rng.randint(0, 12)))
+
+
+# Changes to a well formed frame, most of which the scanner must leave to
+# the XML parser
+MUTATIONS = (
+    lambda text: text.replace("&", "&amp;") + "&amp;",
+    lambda text: text + "&#65;",
+    lambda text: text + "\r\n" + text,
+    lambda text: text + "\t",
+    lambda text: text + "\u00e9",
+    lambda text: text + "\x01",
+    lambda text: text + "]]>",
+    lambda text: text + ">",
+    lambda text: "<![CDATA[" + text + "]]>",
+    lambda text: text + "<!-- comment -->",
+    lambda text: text + "<Nested>1</Nested>",
+)
+
+
+def random_frame(rng: random.Random, emu) -> bytes:
+    """A notification with random values, usually in the format written by the device."""
+    tag = rng.choice(emu.scanner.SCANNED_TAGS * 3 + ("CurrentPeriodUsage", "MeterList", "TimeCluster"))
+    klass = emu.entities.Entity.tag_to_class(tag)
+    children = [[name, random_text(rng)] for name in klass.field_tags() + tuple(klass._list_map) if rng.random() > 0.05]
+
+    unusual = rng.random() < 0.3
+    if unusual:
+        for _ in range(rng.randint(1, 3)):
+            change = rng.randrange(8)
+            if change == 0 and children:
+                children.insert(rng.randrange(len(children)), list(rng.choice(children)))
+            elif change == 1:
+                children.append([rng.choice(("Unknown", "Extra_1", "a.b-c")), random_text(rng)])
+            elif change == 2:
+                rng.shuffle(children)
+            elif change == 3 and children:
+                child = rng.choice(children)
+                child[1] = rng.choice(MUTATIONS)(child[1] or "")
+            elif change == 4 and children:
+                rng.choice(children)[1] = None
+            elif change == 5:
+                tag += rng.choice((' id="1"', " ", "\n"))
+            elif change == 6 and children:
+                child = rng.choice(children)
+                child[0] += ' a="1"'
+
+    separator = rng.choice(("\r\n  ", "\n", "", " ", "\t")) if unusual else "\r\n  "
+    parts = ["<" + tag + ">"]
+    for name, text in children:
+        if text is None:
+            parts.append(rng.choice(("<%s/>" % name, "<%s></%s>" % (name, name.split()[0]))))
+        else:
+            parts.append("<%s>%s</%s>" % (name, text, name.split()[0]))
+    parts.append("</" + tag.split()[0] + ">")
+    frame = separator.join(parts) + "\r\n"
+
+    if unusual and rng.random() < 0.1:
+        # Cut off, as when the connection opens part way through a frame
+        frame = frame[rng.randrange(len(frame)):]
+    return frame.encode("utf-8")
+
+
+def chunked(rng: random.Random, data: bytes) -> list:
+    """Data split into chunks of random size, as reads from the device return it."""
+    chunks = []
+    position = 0
+    while position < len(data):
+        size = rng.randint(1, 600)
+        chunks.append(data[position:position + size])
+        position += size
+    return chunks
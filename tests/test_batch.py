@@ -0,0 +1,44 @@
+"""Tests of decoding InstantaneousDemand into numpy columns."""
+import random
+
+import pytest
+
+from corpus import random_frame
+
+pytest.importorskip("numpy")
+
+SEED = 20240611
+FRAMES = 30000
+
+# Columns left out of the batch when out of the range of uint64
+UNSIGNED = ("timestamp", "multiplier", "divisor", "digits_right")
+
+
+def test_columns_match_scalar_decoding(emu):
+    rng = random.Random(SEED)
+    data = b"".join(random_frame(rng, emu) for _ in range(FRAMES))
+
+    expected = {name: [] for name in emu.batch.COLUMNS}
+    for frame in emu.parser.FrameParser().feed(data):
+        if frame.tag != "InstantaneousDemand":
+            continue
+        try:
+            response = emu.entities.InstantaneousDemand(frame)
+            row = {name: getattr(response, name) for name in emu.batch.COLUMNS}
+        except ValueError:
+            continue
+        if not all(0 <= row[name] < 2 ** 64 for name in UNSIGNED):
+            continue
+        for name, value in row.items():
+            expected[name].append(value)
+
+    columns = emu.batch.decode_demand(data)
+    assert len(expected["reading"]) > 0
+    for name in emu.batch.COLUMNS:
+        assert columns[name].tolist() == expected[name], name
+
+
+def test_empty_input(emu):
+    columns = emu.batch.decode_demand(b"")
+    assert set(columns) == set(emu.batch.COLUMNS)
+    assert all(len(column) == 0 for column in columns.values())
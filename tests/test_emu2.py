@@ -0,0 +1,91 @@
+"""Tests of decoding responses in Emu2."""
+import time
+
+import pytest
+
+DEMAND = (
+    b"<InstantaneousDemand>\r\n"
+    b"  <DeviceMacId>0xd8d5b9000000abcd</DeviceMacId>\r\n"
+    b"  <MeterMacId>0x00135003001234ab</MeterMacId>\r\n"
+    b"  <TimeStamp>0x2c5a1b3f</TimeStamp>\r\n"
+    b"  <Demand>0x0004d2</Demand>\r\n"
+    b"  <Multiplier>0x00000001</Multiplier>\r\n"
+    b"  <Divisor>0x000003e8</Divisor>\r\n"
+    b"  <DigitsRight>0x03</DigitsRight>\r\n"
+    b"  <DigitsLeft>0x06</DigitsLeft>\r\n"
+    b"  <SuppressLeadingZero>Y</SuppressLeadingZero>\r\n"
+    b"</InstantaneousDemand>\r\n"
+)
+
+FRAMES = 20000
+
+
+@pytest.mark.parametrize("scanned", (False, True))
+def test_response_is_shared_and_read_only(emu, scanned):
+    client = emu.emu2.Emu2(None, "", 0)
+    received = []
+    client.register_process_callback(lambda response_type, response: received.append(response))
+
+    parser = emu.parser.FrameParser(emu.scanner.Scanner() if scanned else None)
+    for frame in parser.feed(DEMAND):
+        client._process_reply(frame)
+
+    assert len(received) == 1
+    response = received[0]
+    assert client.get_data(emu.entities.InstantaneousDemand) is response
+    assert response.reading == 1.234
+
+    with pytest.raises(AttributeError):
+        response.reading = 0
+    with pytest.raises(AttributeError):
+        response.demand = 0
+    with pytest.raises(AttributeError):
+        del response.meter_mac
+    assert response.reading == 1.234
+
+
+def test_decode_cost_per_frame(emu, monkeypatch, record_property, capsys):
+    client = emu.emu2.Emu2(None, "", 0)
+    client.register_process_callback(lambda response_type, response: None)
+    frames = emu.parser.FrameParser().feed(DEMAND * FRAMES)
+    assert len(frames) == FRAMES
+
+    start = time.perf_counter()
+    for frame in frames:
+        client._process_reply(frame)
+    elapsed = time.perf_counter() - start
+
+    cost = elapsed / FRAMES * 1e6
+    record_property("decode_us_per_frame", cost)
+    with capsys.disabled():
+        print(f"\nInstantaneousDemand: {cost:.2f} us per frame decoded and passed to the callback")
+
+    # Each frame is decoded once, for the cache and the callback together
+    decoded = 0
+    parse = emu.entities.InstantaneousDemand._parse
+
+    def counting_parse(self):
+        nonlocal decoded
+        decoded += 1
+        parse(self)
+
+    monkeypatch.setattr(emu.entities.InstantaneousDemand, "_parse", counting_parse)
+    for frame in frames[:100]:
+        client._process_reply(frame)
+    assert decoded == 100
+
+
+@pytest.mark.parametrize("scanned", (False, True))
+def test_bad_field_text_is_rejected_before_caching(emu, scanned):
+    client = emu.emu2.Emu2(None, "", 0)
+    received = []
+    client.register_process_callback(lambda response_type, response: received.append(response))
+
+    parser = emu.parser.FrameParser(emu.scanner.Scanner() if scanned else None)
+    frames = parser.feed(DEMAND.replace(b"0x0004d2", b"0x00zz"))
+    assert len(frames) == 1
+    with pytest.raises(ValueError):
+        client._process_reply(frames[0])
+
+    assert received == []
+    assert client.get_data(emu.entities.InstantaneousDemand) is None
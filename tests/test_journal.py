@@ -0,0 +1,59 @@
+"""Tests of the reading journal."""
+from rainforest_emu_2.emu2_journal import Journal, read_journal, read_meters
+
+
+def test_meters_keep_their_index_across_reopen(tmp_path):
+    journal = Journal(str(tmp_path))
+    journal.open()
+    journal.append(1.0, "A", "power", 1.5)
+    journal.append(2.0, "B", "power", 2.5)
+    journal.write(*journal.take())
+    journal.close()
+
+    journal = Journal(str(tmp_path))
+    journal.open()
+    journal.append(3.0, "B", "power", 3.5)
+    journal.append(4.0, "C", "current_price", 0.25)
+    journal.write(*journal.take())
+    journal.close()
+
+    assert read_meters(str(tmp_path)) == ["A", "B", "C"]
+    assert list(read_journal(str(tmp_path))) == [
+        (1.0, "A", "power", 1.5),
+        (2.0, "B", "power", 2.5),
+        (3.0, "B", "power", 3.5),
+        (4.0, "C", "current_price", 0.25),
+    ]
+
+
+def test_restored_meters_are_written_once(tmp_path):
+    journal = Journal(str(tmp_path))
+    journal.open()
+    journal.append(1.0, "A", "power", 1.5)
+    data, meters = journal.take()
+    journal.write(data, meters)
+
+    # As after a batch whose write failed once the meters were written
+    journal.restore_meters(meters)
+    journal.append(2.0, "B", "power", 2.5)
+    journal.write(*journal.take())
+    journal.close()
+
+    assert read_meters(str(tmp_path)) == ["A", "B"]
+    assert [meter_mac for _, meter_mac, _, _ in read_journal(str(tmp_path))] == ["A", "B"]
+
+
+def test_restored_meters_keep_their_order(tmp_path):
+    journal = Journal(str(tmp_path))
+    journal.open()
+    journal.append(1.0, "A", "power", 1.5)
+    _, meters = journal.take()
+
+    # The batch with A failed to write, and B arrived since
+    journal.append(2.0, "B", "power", 2.5)
+    journal.restore_meters(meters)
+    journal.write(*journal.take())
+    journal.close()
+
+    assert read_meters(str(tmp_path)) == ["A", "B"]
+    assert [meter_mac for _, meter_mac, _, _ in read_journal(str(tmp_path))] == ["B"]
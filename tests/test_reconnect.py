@@ -0,0 +1,64 @@
+"""Tests of reconnecting in Emu2.run against a local TCP server."""
+import asyncio
+
+from test_emu2 import DEMAND
+
+RECONNECTS = 6
+
+
+async def _run_until_reconnects(emu, monkeypatch, handle):
+    monkeypatch.setattr(emu.emu2, "RECONNECT_MIN_DELAY", 0.002)
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+
+    client = emu.emu2.Emu2(None, "127.0.0.1", port)
+    delays = []
+    reconnect_delay = client._reconnect_delay
+
+    def record_delay(attempt):
+        delay = reconnect_delay(attempt)
+        delays.append(delay)
+        return delay
+
+    client._reconnect_delay = record_delay
+
+    task = asyncio.ensure_future(client.run())
+    try:
+        while client.reconnects < RECONNECTS:
+            await asyncio.sleep(0.01)
+    finally:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        await client.close()
+        server.close()
+        await server.wait_closed()
+    return client, delays
+
+
+def test_backoff_grows_when_the_connection_drops(emu, monkeypatch):
+    monkeypatch.setattr(emu.emu2.random, "uniform", lambda low, high: 1.0)
+
+    async def drop(reader, writer):
+        writer.close()
+
+    client, delays = asyncio.run(_run_until_reconnects(emu, monkeypatch, drop))
+
+    assert client.reconnects >= RECONNECTS
+    assert delays[:RECONNECTS] == [0.002 * 2 ** attempt for attempt in range(RECONNECTS)]
+
+
+def test_backoff_resets_after_a_frame(emu, monkeypatch):
+    monkeypatch.setattr(emu.emu2.random, "uniform", lambda low, high: 1.0)
+
+    async def send_frame_and_drop(reader, writer):
+        writer.write(DEMAND)
+        await writer.drain()
+        writer.close()
+
+    client, delays = asyncio.run(_run_until_reconnects(emu, monkeypatch, send_frame_and_drop))
+
+    assert client.reconnects >= RECONNECTS
+    assert delays[:RECONNECTS] == [0.002] * RECONNECTS
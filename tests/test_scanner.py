@@ -0,0 +1,76 @@
+"""Differential test of the scanner against the XML parser."""
+import random
+
+from corpus import chunked, random_frame
+
+SEED = 20240611
+FRAMES = 30000
+
+
+def decode(emu, frame):
+    """Decode a frame from FrameParser as Emu2 does."""
+    klass = emu.entities.Entity.tag_to_class(frame.tag)
+    if klass is None:
+        return None
+    if isinstance(frame, emu.scanner.Fragment):
+        return klass.from_fields(frame.fields)
+    return klass(frame)
+
+
+def values(response) -> dict:
+    """Every public value of a response, or the type of the exception reading it raised."""
+    result = {}
+    for name in dir(type(response)):
+        if name.startswith("_") or callable(getattr(type(response), name)):
+            continue
+        try:
+            value = getattr(response, name)
+            if hasattr(value, "tolist"):
+                value = value.tolist()
+            result[name] = (type(value).__name__, value)
+        except Exception as ex:
+            result[name] = (type(ex).__name__, None)
+    return result
+
+
+def decoded_values(emu, frame):
+    """The values of a decoded frame, None for an unknown tag, or the type of the exception decoding raised."""
+    try:
+        response = decode(emu, frame)
+    except Exception as ex:
+        return type(ex).__name__
+    if response is None:
+        return None
+    return values(response)
+
+
+def test_scanner_matches_xml_parser(emu):
+    rng = random.Random(SEED)
+    corpus = b"".join(random_frame(rng, emu) for _ in range(FRAMES))
+
+    xml = emu.parser.FrameParser()
+    scanned = emu.parser.FrameParser(emu.scanner.Scanner())
+
+    frames = fragments = 0
+    mismatches = []
+    for data in chunked(rng, corpus):
+        expected = xml.feed(data)
+        actual = scanned.feed(data)
+        assert len(expected) == len(actual), f"frame {frames}"
+
+        for tree, frame in zip(expected, actual):
+            frames += 1
+            if isinstance(frame, emu.scanner.Fragment):
+                fragments += 1
+
+            want = decoded_values(emu, tree)
+            got = decoded_values(emu, frame)
+            if want != got:
+                mismatches.append((tree.tag, want, got))
+
+    assert mismatches[:10] == []
+    assert xml.failures == scanned.failures
+
+    # Both paths are exercised
+    assert 0 < fragments < frames
+    assert xml.failures > 0
@@ -0,0 +1,507 @@
+"""Record, replay and benchmark EMU-2 byte streams.
+
+Captures hold the raw bytes read from the device with the time each chunk
+arrived. They can be recorded from a device or a USB to TCP converter, or
+generated from the simulator, and replayed through the same read loop the
+integration uses. Replay stops at the Emu2 callback, as Home Assistant is
+not needed, so RainforestEmu2Device._process_update, with the per-meter
+readings, history, journal and subscriptions, is not replayed or timed.
+
+    python tools/emu2_benchmark.py record --tcp 127.0.0.1:5000 --seconds 600 trace.cap
+    python tools/emu2_benchmark.py generate --frames 100000 trace.cap
+    python tools/emu2_benchmark.py replay --realtime trace.cap
+    python tools/emu2_benchmark.py bench trace.cap
+    python tools/emu2_benchmark.py batch trace.cap
+
+bench reports the throughput of the whole read loop, then the frames per
+second and bytes allocated per frame when frames are read as the read loop
+did before FrameParser, by concatenating lines and parsing each frame whole,
+and by the frame parser with and without the scanner. It then reports the
+decode latency and the memory held by decoded responses for each entity
+type, and the memory held per InstantaneousDemand compared with responses
+which kept their element. batch decodes the demand notifications of a
+capture, or of simulated notifications, into numpy columns and fails if
+any value differs from decoding them one at a time. The scanner and the
+batch decoder are checked against a randomized corpus by the tests.
+Needs pyserial-asyncio, as the integration does, but not Home Assistant.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import collections
+import gc
+import itertools
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+import types
+from xml.etree import ElementTree
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = os.path.join(ROOT, "custom_components", "rainforest_emu_2")
+
+_LOGGER = logging.getLogger("emu2_benchmark")
+
+
+def load_package() -> types.ModuleType:
+    """Import the integration modules without Home Assistant.
+
+    The package __init__ sets up the Home Assistant integration, so the
+    package is created empty and only the emu2 modules are imported.
+    """
+    package = types.ModuleType("rainforest_emu_2")
+    package.__path__ = [PACKAGE]
+    sys.modules["rainforest_emu_2"] = package
+
+    from rainforest_emu_2 import emu2, emu2_batch, emu2_capture, emu2_entities, emu2_parser, emu2_scanner
+    return types.SimpleNamespace(
+        emu2=emu2, batch=emu2_batch, capture=emu2_capture, entities=emu2_entities, parser=emu2_parser,
+        scanner=emu2_scanner
+    )
+
+
+def percentile(sorted_values: list, fraction: float):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+async def record(args: argparse.Namespace, emu: types.SimpleNamespace) -> None:
+    host, port = "", 0
+    if args.tcp:
+        host, _, port = args.tcp.rpartition(":")
+        host = host or "127.0.0.1"
+    client = emu.emu2.Emu2(args.device or "", host, int(port))
+    capture = client.start_capture(args.capture)
+
+    task = asyncio.ensure_future(client.run())
+    try:
+        await asyncio.sleep(args.seconds)
+    finally:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        client.stop_capture()
+        await client.close()
+
+    print(f"Recorded {capture.chunks} chunks, {capture.bytes} bytes to {args.capture}")
+
+
+def simulated_frames(count: int, meters: int = 1):
+    """Notifications from the simulator, mostly InstantaneousDemand as a device sends them."""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from emu2_simulator import Meter
+
+    meters = [Meter(index) for index in range(meters)]
+    kinds = [
+        (Meter.instantaneous_demand, 8),
+        (Meter.current_summation_delivered, 1),
+        (Meter.price_cluster, 1),
+        (Meter.current_period_usage, 1),
+    ]
+    weights = [weight for _, weight in kinds]
+
+    for _ in range(count):
+        meter = random.choice(meters)
+        meter.step()
+        build = random.choices(kinds, weights)[0][0]
+        yield build(meter)
+
+
+def generate(args: argparse.Namespace, emu: types.SimpleNamespace) -> None:
+    """Write a capture of simulated notifications, one chunk per line as read from a serial port."""
+    writer = emu.capture.CaptureWriter(args.capture)
+    offset = 0.0
+    for frame in simulated_frames(args.frames, args.meters):
+        if args.garbage_rate and random.random() < args.garbage_rate:
+            frame = b"<InstantaneousDemand>\r\n  <Demand>0x0\r\n" + frame
+
+        offset += args.interval
+        for line in frame.splitlines(keepends=True):
+            writer.write(line, offset)
+    writer.close()
+
+    print(f"Generated {args.frames} frames, {writer.chunks} chunks, {writer.bytes} bytes to {args.capture}")
+
+
+async def replay(path: str, emu: types.SimpleNamespace, realtime=False, speed=1.0):
+    """Replay a capture through Emu2.serial_read, returning the frames received by type and the elapsed time.
+
+    Responses are counted by the callback rather than passed to RainforestEmu2Device._process_update.
+    """
+    client = emu.emu2.Emu2(None, "", 0)
+    client.use_connection(emu.capture.replay_connection(path, realtime, speed))
+
+    counts = collections.Counter()
+    client.register_process_callback(lambda response_type, response: counts.update((response_type,)))
+
+    start = time.perf_counter()
+    await client.serial_read()
+    elapsed = time.perf_counter() - start
+    await client.close()
+    return counts, elapsed
+
+
+def decode(emu: types.SimpleNamespace, frame):
+    """Decode a frame from FrameParser as Emu2 does."""
+    klass = emu.entities.Entity.tag_to_class(frame.tag)
+    if klass is None:
+        return None
+    if isinstance(frame, emu.scanner.Fragment):
+        return klass.from_fields(frame.fields)
+    return klass(frame)
+
+
+def legacy_frames(emu: types.SimpleNamespace, chunks: list):
+    """Frames as the read loop built them before FrameParser.
+
+    Each line read is concatenated onto the frame until a closing tag, and
+    the frame is then parsed whole inside a synthetic root element.
+    """
+    pending = b""
+    response = ""
+    for data in chunks:
+        pending += data
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            line = line.decode("utf-8", "replace").strip()
+            response += line
+            if line.startswith("</"):
+                try:
+                    root = ElementTree.fromstringlist(itertools.chain("<Root>", response, "</Root>"))
+                except ElementTree.ParseError:
+                    root = ()
+                response = ""
+                yield from root
+
+
+def parser_frames(emu: types.SimpleNamespace, chunks: list, scanner=None):
+    """Frames from FrameParser, with or without the scanner."""
+    parser = emu.parser.FrameParser(scanner)
+    for data in chunks:
+        yield from parser.feed(data)
+
+
+def parser_stats(path: str, emu: types.SimpleNamespace, repeat: int = 3) -> dict:
+    """Frames per second parsed and decoded, and bytes allocated per frame, for each way of reading frames.
+
+    Allocations are the peak traced by tracemalloc while reading and
+    decoding each frame, added up over the capture, so memory which is
+    freed again straight away is counted as well.
+    """
+    _, chunks = emu.capture.read_capture(path)
+    chunks = [data for _, data in chunks]
+
+    paths = (
+        ("lines", lambda: legacy_frames(emu, chunks)),
+        ("xml", lambda: parser_frames(emu, chunks)),
+        ("scanner", lambda: parser_frames(emu, chunks, emu.scanner.Scanner())),
+    )
+
+    results = {}
+    for name, frames_of in paths:
+        best = None
+        for _ in range(repeat):
+            gc.collect()
+            frames = 0
+            start = time.perf_counter()
+            for frame in frames_of():
+                decode(emu, frame)
+                frames += 1
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        gc.collect()
+        allocated = 0
+        tracemalloc.start()
+        iterator = frames_of()
+        while True:
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            frame = next(iterator, None)
+            if frame is not None:
+                decode(emu, frame)
+            _, peak = tracemalloc.get_traced_memory()
+            allocated += peak - current
+            if frame is None:
+                break
+        tracemalloc.stop()
+
+        results[name] = {
+            "rate": frames / best,
+            "allocated": allocated / frames if frames else 0,
+        }
+    return results
+
+
+def decode_stats(path: str, emu: types.SimpleNamespace) -> dict:
+    """Decode latency in microseconds, and the memory held per response, for each entity type."""
+    _, chunks = emu.capture.read_capture(path)
+
+    parser = emu.parser.FrameParser()
+    trees = collections.defaultdict(list)
+    for _, data in chunks:
+        for tree in parser.feed(data):
+            trees[tree.tag].append(tree)
+
+    results = {}
+    for tag, elements in sorted(trees.items()):
+        klass = emu.entities.Entity.tag_to_class(tag)
+        if klass is None:
+            continue
+
+        latencies = []
+        for tree in elements:
+            start = time.perf_counter_ns()
+            klass(tree)
+            latencies.append((time.perf_counter_ns() - start) / 1000)
+        latencies.sort()
+
+        # Peak memory while keeping every decoded response, as a cache would
+        gc.collect()
+        tracemalloc.start()
+        kept = [klass(tree) for tree in elements]
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del kept
+
+        results[tag] = {
+            "frames": len(elements),
+            "p50": percentile(latencies, 0.50),
+            "p99": percentile(latencies, 0.99),
+            "peak": peak,
+        }
+    return results
+
+
+class LegacyInstantaneousDemand:
+    """InstantaneousDemand as it was decoded before responses used __slots__.
+
+    The element is kept, and every field is set in the instance __dict__.
+    """
+
+    def __init__(self, tree):
+        self._tree = tree
+        self.device_mac = self.find_text("DeviceMacId")
+        self.meter_mac = self.find_text("MeterMacId")
+        self.timestamp = self.find_hex("TimeStamp")
+        self.demand = self.find_hex("Demand")
+        self.multiplier = self.find_hex("Multiplier")
+        self.divisor = self.find_hex("Divisor")
+        self.digits_right = self.find_hex("DigitsRight")
+        self.digits_left = self.find_hex("DigitsLeft")
+        self.suppress_leading_zero = self.find_text("SuppressLeadingZero")
+
+        self.demand = -(self.demand & 0x80000000) | (self.demand & 0x7fffffff)
+        if self.divisor != 0:
+            self.reading = round(self.demand * self.multiplier / float(self.divisor), self.digits_right)
+        else:
+            self.reading = 0
+
+    def find_text(self, tag):
+        node = self._tree.find(tag)
+        if node is None:
+            return None
+        return node.text
+
+    def find_hex(self, tag):
+        return int(self.find_text(tag) or "0x00", 16)
+
+
+def retained_bytes(build, frames: list) -> float:
+    """Bytes still held per response once every frame has been parsed and decoded by build."""
+    gc.collect()
+    tracemalloc.start()
+    kept = [build(frame) for frame in frames]
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return retained / len(frames)
+
+
+def demand_memory(path: str, emu: types.SimpleNamespace) -> dict:
+    """Bytes held per decoded InstantaneousDemand, before __slots__ and now.
+
+    Each frame is parsed inside the measurement, so the element is counted
+    when the response keeps it.
+    """
+    _, chunks = emu.capture.read_capture(path)
+    frames = [
+        ElementTree.tostring(tree)
+        for tree in parser_frames(emu, [data for _, data in chunks])
+        if tree.tag == "InstantaneousDemand"
+    ]
+    if not frames:
+        return None
+
+    parser = emu.parser.FrameParser(emu.scanner.Scanner())
+    return {
+        "before": retained_bytes(lambda frame: LegacyInstantaneousDemand(ElementTree.fromstring(frame)), frames),
+        "xml": retained_bytes(lambda frame: decode(emu, ElementTree.fromstring(frame)), frames),
+        "scanner": retained_bytes(lambda frame: decode(emu, parser.feed(frame + b"\r\n")[0]), frames),
+    }
+
+
+async def bench(args: argparse.Namespace, emu: types.SimpleNamespace) -> None:
+    counts, elapsed = await replay(args.capture, emu)
+    frames = sum(counts.values())
+    print(f"Read loop: {frames} frames in {elapsed:.3f}s, {frames / elapsed:,.0f} frames/s")
+
+    stats = parser_stats(args.capture, emu)
+    baseline = stats["lines"]["rate"]
+    print(f"{'Parse and decode':<28}{'Frames/s':>12}{'Speedup':>10}{'Alloc B/frame':>15}")
+    for name, label in (
+        ("lines", "Line concatenation"),
+        ("xml", "FrameParser"),
+        ("scanner", "FrameParser and scanner"),
+    ):
+        print(
+            f"{label:<28}{stats[name]['rate']:>12,.0f}{stats[name]['rate'] / baseline:>9.1f}x"
+            f"{stats[name]['allocated']:>15,.0f}"
+        )
+
+    print(f"{'Entity':<28}{'Frames':>10}{'p50 us':>10}{'p99 us':>10}{'Peak KiB':>11}{'B/frame':>10}")
+    for tag, stats in decode_stats(args.capture, emu).items():
+        print(
+            f"{tag:<28}{stats['frames']:>10}{stats['p50']:>10.1f}{stats['p99']:>10.1f}"
+            f"{stats['peak'] / 1024:>11.1f}{stats['peak'] / stats['frames']:>10.0f}"
+        )
+
+    memory = demand_memory(args.capture, emu)
+    if memory is not None:
+        print(
+            f"InstantaneousDemand kept: {memory['before']:,.0f} B/frame with the element and __dict__, "
+            f"{memory['xml']:,.0f} B/frame now from the XML parser, {memory['scanner']:,.0f} B/frame from the scanner"
+        )
+
+
+def batch(args: argparse.Namespace, emu: types.SimpleNamespace) -> bool:
+    """Decode demand notifications in columns and one at a time, returns True if both agree."""
+    if args.capture:
+        _, chunks = emu.capture.read_capture(args.capture)
+        data = b"".join(chunk for _, chunk in chunks)
+    else:
+        data = b"".join(simulated_frames(args.frames))
+
+    start = time.perf_counter()
+    expected = {name: [] for name in emu.batch.COLUMNS}
+    skipped = 0
+    for frame in emu.parser.FrameParser().feed(data):
+        if frame.tag != "InstantaneousDemand":
+            continue
+        try:
+            response = emu.entities.InstantaneousDemand(frame)
+            row = {name: getattr(response, name) for name in emu.batch.COLUMNS}
+        except ValueError:
+            continue
+        # Left out of the columns, which hold unsigned 64 bit numbers
+        if not all(0 <= row[name] < 2 ** 64 for name in ("timestamp", "multiplier", "divisor", "digits_right")):
+            skipped += 1
+            continue
+        for name, value in row.items():
+            expected[name].append(value)
+    scalar = time.perf_counter() - start
+
+    start = time.perf_counter()
+    columns = emu.batch.decode_demand(data)
+    vector = time.perf_counter() - start
+
+    rows = len(expected["reading"])
+    mismatches = 0
+    for name in emu.batch.COLUMNS:
+        actual = columns[name].tolist()
+        if len(actual) != rows:
+            print(f"{name}: {len(actual)} rows in columns, {rows} one at a time")
+            return False
+        for index, (want, got) in enumerate(zip(expected[name], actual)):
+            if want != got:
+                mismatches += 1
+                if mismatches <= 10:
+                    print(f"Row {index} {name}: {want!r} != {got!r}")
+
+    print(
+        f"{rows} rows, {skipped} out of range, {mismatches} mismatches, {rows / scalar:,.0f} rows/s one at a time, "
+        f"{rows / vector:,.0f} rows/s in columns ({scalar / vector:.1f}x)"
+    )
+    return mismatches == 0
+
+
+async def main(args: argparse.Namespace) -> None:
+    emu = load_package()
+
+    if args.command == "record":
+        await record(args, emu)
+    elif args.command == "generate":
+        generate(args, emu)
+    elif args.command == "replay":
+        counts, elapsed = await replay(args.capture, emu, args.realtime, args.speed)
+        for response_type, count in counts.most_common():
+            print(f"{response_type:<28}{count:>10}")
+        print(f"{sum(counts.values())} frames in {elapsed:.3f}s")
+    elif args.command == "bench":
+        await bench(args, emu)
+    elif args.command == "batch":
+        if not batch(args, emu):
+            sys.exit(1)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-v", "--verbose", action="store_true")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = commands.add_parser("record", help="record a capture from a device")
+    record_parser.add_argument("--tcp", metavar="HOST:PORT", help="connect over TCP")
+    record_parser.add_argument("--device", help="serial device path")
+    record_parser.add_argument("--seconds", type=float, default=60, help="how long to record")
+    record_parser.add_argument("capture")
+
+    generate_parser = commands.add_parser("generate", help="generate a capture from the simulator")
+    generate_parser.add_argument("--frames", type=int, default=10000, help="number of frames")
+    generate_parser.add_argument("--meters", type=int, default=1, help="number of meters")
+    generate_parser.add_argument("--interval", type=float, default=1.0,
+                                 help="seconds between frames when replayed in real time")
+    generate_parser.add_argument("--garbage-rate", type=float, default=0,
+                                 help="probability of a malformed frame before each frame")
+    generate_parser.add_argument("--seed", type=int, help="random seed")
+    generate_parser.add_argument("capture")
+
+    replay_parser = commands.add_parser("replay", help="replay a capture through the read loop")
+    replay_parser.add_argument("--realtime", action="store_true",
+                               help="replay at the recorded speed rather than as fast as possible")
+    replay_parser.add_argument("--speed", type=float, default=1.0,
+                               help="speed up real time replay by this factor")
+    replay_parser.add_argument("capture")
+
+    bench_parser = commands.add_parser("bench", help="benchmark the parser and decoders on a capture")
+    bench_parser.add_argument("capture")
+
+    batch_parser = commands.add_parser("batch", help="check and time decoding demand in numpy columns")
+    batch_parser.add_argument("--frames", type=int, default=100000,
+                              help="number of simulated frames used without a capture")
+    batch_parser.add_argument("--seed", type=int, help="random seed")
+    batch_parser.add_argument("capture", nargs="?")
+
+    args = parser.parse_args(argv)
+    if args.command == "record" and not args.tcp and not args.device:
+        parser.error("record needs --tcp or --device")
+    return args
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    logging.basicConfig(level=logging.DEBUG if arguments.verbose else logging.WARNING)
+    if getattr(arguments, "seed", None) is not None:
+        random.seed(arguments.seed)
+    try:
+        asyncio.run(main(arguments))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,504 @@
+"""Simulated Rainforest EMU-2 for benchmarking and testing.
+
+Serves the RAVEn XML protocol over TCP, in the same way as a USB to TCP
+converter such as ser2net, and/or over a pseudo terminal that can be used
+as the device path of a serial connection.
+
+    python tools/emu2_simulator.py --tcp 127.0.0.1:5000 --pty
+
+Commands sent by the integration are answered, and the demand, summation
+and price notifications are sent at configurable rates. Frames can be
+split across writes and malformed frames injected to exercise the parser.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import time
+import tty
+from xml.etree import ElementTree
+
+_LOGGER = logging.getLogger("emu2_simulator")
+
+# Rainforest timestamps are seconds since 2000-01-01 UTC
+RAINFOREST_EPOCH = 946684800
+
+DEVICE_MAC = "0xd8d5b90000001234"
+
+EVENTS = ("time", "summation", "billing_period", "block_period",
+          "message", "price", "scheduled_prices", "demand")
+
+
+def _hex(value: int, digits: int = 8) -> str:
+    return "0x{:0{digits}x}".format(value & (16 ** digits - 1), digits=digits)
+
+
+def _now() -> int:
+    return int(time.time()) - RAINFOREST_EPOCH
+
+
+def build_frame(tag: str, fields: dict[str, str]) -> bytes:
+    """Build a fragment in the format written by the device."""
+    lines = [f"<{tag}>"]
+    for name, value in fields.items():
+        lines.append(f"  <{name}>{value}</{name}>")
+    lines.append(f"</{tag}>")
+    return ("\r\n".join(lines) + "\r\n").encode("ascii")
+
+
+class Meter:
+    """Readings for a single meter, which drift as time passes."""
+
+    def __init__(self, index: int):
+        self.mac = "0x00135001{:08x}".format(0x10000 + index)
+        self.demand = random.randint(200, 3000)
+        self.delivered = random.randint(1_000_000, 50_000_000)
+        self.received = random.randint(0, 1_000_000)
+        self.period_start = _now() - 86400
+        self.period_usage = 0
+        self.price = random.randint(900, 3500)
+
+    def step(self) -> None:
+        self.demand = max(-5000, min(20000, self.demand + random.randint(-150, 150)))
+        if self.demand >= 0:
+            self.delivered += self.demand // 100
+            self.period_usage += self.demand // 100
+        else:
+            self.received -= self.demand // 100
+
+    def _metering(self) -> dict[str, str]:
+        return {
+            "Multiplier": _hex(1),
+            "Divisor": _hex(1000),
+            "DigitsRight": _hex(3, 2),
+            "DigitsLeft": _hex(6, 2),
+            "SuppressLeadingZero": "Y",
+        }
+
+    def instantaneous_demand(self) -> bytes:
+        return build_frame("InstantaneousDemand", {
+            "DeviceMacId": DEVICE_MAC,
+            "MeterMacId": self.mac,
+            "TimeStamp": _hex(_now()),
+            # Negative demand, when the meter is exporting, is sent as 32 bit two's complement
+            "Demand": _hex(self.demand, 6 if self.demand >= 0 else 8),
+            **self._metering(),
+        })
+
+    def current_summation_delivered(self) -> bytes:
+        return build_frame("CurrentSummationDelivered", {
+            "DeviceMacId": DEVICE_MAC,
+            "MeterMacId": self.mac,
+            "TimeStamp": _hex(_now()),
+            "SummationDelivered": _hex(self.delivered, 16),
+            "SummationReceived": _hex(self.received, 16),
+            **self._metering(),
+        })
+
+    def current_period_usage(self) -> bytes:
+        return build_frame("CurrentPeriodUsage", {
+            "DeviceMacId": DEVICE_MAC,
+            "MeterMacId": self.mac,
+            "TimeStamp": _hex(_now()),
+            "CurrentUsage": _hex(self.period_usage),
+            **self._metering(),
+            "StartDate": _hex(self.period_start),
+        })
+
+    def last_period_usage(self) -> bytes:
+        return build_frame("LastPeriodUsage", {
+            "DeviceMacId": DEVICE_MAC,
+            "MeterMacId": self.mac,
+            "LastUsage": _hex(self.period_usage // 2),
+            **self._metering(),
+            "StartDate": _hex(self.period_start - 86400),
+            "EndDate": _hex(self.period_start),
+        })
+
+    def profile_data(self, periods: int, end_time: int, channel: str) -> bytes:
+        """15 minute intervals ending at end_time, or the last whole interval when 0."""
+        if not end_time:
+            end_time = _now() - _now() % 900
+        base = self.demand if channel == "Delivered" else 0
+        intervals = [_hex(max(0, base // 4 + random.randint(-50, 50)), 6) for _ in range(periods)]
+        return build_frame("ProfileData", {
+            "DeviceMacId": DEVICE_MAC,
+            "MeterMacId": self.mac,
+            "EndTime": _hex(end_time),
+            "Status": _hex(0, 2),
+            "ProfileIntervalPeriod": _hex(3, 2),
+            "NumberOfPeriodsDelivered": _hex(periods, 2),
+            "IntervalData": ",".join(intervals),
+        })
+
+    def price_cluster(self) -> bytes:
+        return build_frame("PriceCluster", {
+            "DeviceMacId": DEVICE_MAC,
+            "MeterMacId": self.mac,
+            "TimeStamp": _hex(_now()),
+            "Price": _hex(self.price),
+            "Currency": _hex(840, 4),
+            "TrailingDigits": _hex(5, 2),
+            "Tier": _hex(1, 2),
+            "RateLabel": "Set by User",
+        })
+
+    def time_cluster(self) -> bytes:
+        return build_frame("TimeCluster", {
+            "DeviceMacId": DEVICE_MAC,
+            "MeterMacId": self.mac,
+            "UTCTime": _hex(_now()),
+            "LocalTime": _hex(_now() - 8 * 3600),
+        })
+
+    def message_cluster(self) -> bytes:
+        return build_frame("MessageCluster", {
+            "DeviceMacId": DEVICE_MAC,
+            "MeterMacId": self.mac,
+            "TimeStamp": _hex(_now()),
+            "Id": _hex(0),
+            "Text": "",
+            "ConfirmationRequired": "N",
+            "Confirmed": "N",
+            "Queue": "Active",
+        })
+
+    def meter_info(self) -> bytes:
+        return build_frame("MeterInfo", {
+            "DeviceMacId": DEVICE_MAC,
+            "MeterMacId": self.mac,
+            "MeterType": _hex(0, 4),
+            "NickName": "",
+            "Enabled": "Y",
+        })
+
+    def connection_status(self) -> bytes:
+        return build_frame("ConnectionStatus", {
+            "DeviceMacId": DEVICE_MAC,
+            "MeterMacId": self.mac,
+            "Status": "Connected",
+            "Channel": "20",
+            "LinkStrength": _hex(100, 2),
+        })
+
+
+class Simulator:
+    """Device state shared by all connections to the simulator."""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.meters = [Meter(i) for i in range(args.meters)]
+
+        # Notification interval, in seconds, for each scheduled event
+        self.intervals = {
+            "demand": args.demand_interval,
+            "summation": args.summation_interval,
+            "price": args.price_interval,
+        }
+        self.fast_poll_until = 0.0
+        self.fast_poll_interval = 0.0
+
+    def meter(self, mac: str | None) -> list[Meter]:
+        if mac is None:
+            return self.meters
+        return [m for m in self.meters if m.mac.lower() == mac.lower()]
+
+    def demand_interval(self) -> float:
+        if time.monotonic() < self.fast_poll_until:
+            return self.fast_poll_interval
+        return self.intervals["demand"]
+
+    def device_info(self) -> bytes:
+        return build_frame("DeviceInfo", {
+            "DeviceMacId": DEVICE_MAC,
+            "InstallCode": "0x0123456789abcdef",
+            "LinkKey": "0x0123456789abcdef0123456789abcdef",
+            "FWVersion": "2.0.0 (7400)",
+            "HWVersion": "2.7.3",
+            "ImageType": "0x2201",
+            "Manufacturer": "Rainforest Automation, Inc.",
+            "ModelId": "Z105-2-EMU2-LEDD_JM",
+            "DateCode": "20150515a2000089",
+        })
+
+    def network_info(self) -> bytes:
+        return build_frame("NetworkInfo", {
+            "DeviceMacId": DEVICE_MAC,
+            "CoordMacId": self.meters[0].mac,
+            "Status": "Connected",
+            "Description": "Successfully Joined",
+            "ExtPanId": self.meters[0].mac,
+            "Channel": "20",
+            "ShortAddr": _hex(0xe3d3, 4),
+            "LinkStrength": _hex(100, 2),
+        })
+
+    def meter_list(self) -> bytes:
+        lines = ["<MeterList>", f"  <DeviceMacId>{DEVICE_MAC}</DeviceMacId>"]
+        lines += [f"  <MeterMacId>{m.mac}</MeterMacId>" for m in self.meters]
+        lines.append("</MeterList>")
+        return ("\r\n".join(lines) + "\r\n").encode("ascii")
+
+    def schedule_info(self, meter: Meter, event: str) -> bytes:
+        interval = self.intervals.get(event, 0)
+        return build_frame("ScheduleInfo", {
+            "DeviceMacId": DEVICE_MAC,
+            "MeterMacId": meter.mac,
+            "Event": event,
+            "Frequency": _hex(int(interval)),
+            "Enabled": "Y" if interval else "N",
+        })
+
+    def handle_command(self, command: ElementTree.Element) -> list[bytes]:
+        """Apply a command and return the frames sent in response."""
+        name = (command.findtext("Name") or "").strip().lower()
+        meters = self.meter(command.findtext("MeterMacId"))
+        event = command.findtext("Event")
+
+        simple = {
+            "get_instantaneous_demand": Meter.instantaneous_demand,
+            "get_current_summation_delivered": Meter.current_summation_delivered,
+            "get_current_period_usage": Meter.current_period_usage,
+            "get_last_period_usage": Meter.last_period_usage,
+            "get_current_price": Meter.price_cluster,
+            "get_time": Meter.time_cluster,
+            "get_message": Meter.message_cluster,
+            "get_meter_info": Meter.meter_info,
+            "get_connection_status": Meter.connection_status,
+        }
+        if name in simple:
+            return [simple[name](m) for m in meters]
+        if name == "get_device_info":
+            return [self.device_info()]
+        if name == "get_network_info":
+            return [self.network_info()]
+        if name == "get_meter_list":
+            return [self.meter_list()]
+        if name == "get_schedule":
+            events = [event] if event else EVENTS
+            return [self.schedule_info(m, e) for m in meters for e in events]
+        if name == "get_profile_data":
+            periods = max(1, min(12, int(command.findtext("NumberOfPeriods", "0x0c"), 16)))
+            end_time = int(command.findtext("EndTime", "0x0"), 16)
+            channel = command.findtext("IntervalChannel", "Delivered")
+            return [m.profile_data(periods, end_time, channel) for m in meters]
+        if name == "set_schedule":
+            if event in self.intervals:
+                enabled = command.findtext("Enabled", "Y") == "Y"
+                frequency = int(command.findtext("Frequency", "0x0"), 16)
+                self.intervals[event] = frequency if enabled else 0
+            return []
+        if name == "set_fast_poll":
+            frequency = int(command.findtext("Frequency", "0x0"), 16)
+            duration = int(command.findtext("Duration", "0x0"), 16)
+            self.fast_poll_interval = self.args.fast_poll_interval or frequency
+            self.fast_poll_until = time.monotonic() + duration * 60 if frequency else 0
+            return []
+        if name == "close_current_period":
+            for m in meters:
+                m.period_start = _now()
+                m.period_usage = 0
+            return []
+        if name in ("set_current_price",):
+            price = int(command.findtext("Price", "0x0"), 16)
+            for m in meters:
+                m.price = price
+            return []
+
+        _LOGGER.info("Ignoring unsupported command %s", name)
+        return []
+
+
+class Session:
+    """A single connection to the simulator."""
+
+    def __init__(self, simulator: Simulator, write):
+        self._simulator = simulator
+        self._args = simulator.args
+        self._write = write
+        self._lock = asyncio.Lock()
+        self._buffer = b""
+        self._tasks: list[asyncio.Task] = []
+        self.frames_sent = 0
+
+    def start(self) -> None:
+        sim = self._simulator
+        self._tasks = [
+            asyncio.ensure_future(self._notify(sim.demand_interval, Meter.instantaneous_demand, step=True)),
+            asyncio.ensure_future(self._notify(lambda: sim.intervals["summation"], Meter.current_summation_delivered)),
+            asyncio.ensure_future(self._notify(lambda: sim.intervals["price"], Meter.price_cluster)),
+        ]
+
+    def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+
+    async def _notify(self, interval, build, step=False) -> None:
+        while True:
+            period = interval()
+            if not period:
+                await asyncio.sleep(1)
+                continue
+
+            await asyncio.sleep(period)
+            for meter in self._simulator.meters:
+                if step:
+                    meter.step()
+                await self.send(build(meter))
+
+    async def send(self, frame: bytes) -> None:
+        args = self._args
+        async with self._lock:
+            if args.garbage_rate and random.random() < args.garbage_rate:
+                await self._send_garbage(frame)
+
+            if args.split:
+                # Write the frame in random sized pieces
+                pos = 0
+                while pos < len(frame):
+                    size = random.randint(1, args.split)
+                    self._write(frame[pos:pos + size])
+                    pos += size
+                    await asyncio.sleep(0)
+            else:
+                self._write(frame)
+            self.frames_sent += 1
+
+    async def _send_garbage(self, frame: bytes) -> None:
+        kind = random.randrange(4)
+        if kind == 0:
+            # The tail of a frame, as seen when connecting mid-frame
+            self._write(frame[len(frame) // 2:])
+        elif kind == 1:
+            # The start of a frame that is never finished
+            self._write(frame[:len(frame) // 2] + b"\r\n")
+        elif kind == 2:
+            # Line noise
+            self._write(bytes(random.randrange(256) for _ in range(random.randint(1, 32))) + b"\r\n")
+        else:
+            # A frame with mismatched tags
+            self._write(frame.replace(b"</DeviceMacId>", b"</DeviceMac>", 1))
+
+    async def receive(self, data: bytes) -> None:
+        self._buffer += data
+        while True:
+            end = self._buffer.find(b"</Command>")
+            if end < 0:
+                break
+            start = self._buffer.find(b"<Command>")
+            raw = self._buffer[start:end + len(b"</Command>")] if start >= 0 else b""
+            self._buffer = self._buffer[end + len(b"</Command>"):]
+
+            try:
+                command = ElementTree.fromstring(raw)
+            except ElementTree.ParseError:
+                _LOGGER.warning("Malformed command: %s", raw)
+                continue
+
+            _LOGGER.debug("Command %s", raw)
+            if self._args.response_delay:
+                await asyncio.sleep(self._args.response_delay)
+            for frame in self._simulator.handle_command(command):
+                await self.send(frame)
+
+
+async def serve_tcp(simulator: Simulator, host: str, port: int) -> asyncio.AbstractServer:
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        peer = writer.get_extra_info("peername")
+        _LOGGER.info("Connection from %s", peer)
+
+        session = Session(simulator, writer.write)
+        session.start()
+        try:
+            while data := await reader.read(1024):
+                await session.receive(data)
+        except ConnectionError:
+            pass
+        finally:
+            session.stop()
+            writer.close()
+            _LOGGER.info("Connection from %s closed, %d frames sent", peer, session.frames_sent)
+
+    server = await asyncio.start_server(handle, host, port)
+    _LOGGER.info("Listening on %s:%d", host, port)
+    return server
+
+
+def serve_pty(simulator: Simulator) -> Session:
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    print(f"Serial device: {os.ttyname(slave)}", flush=True)
+
+    def write(data: bytes) -> None:
+        try:
+            os.write(master, data)
+        except BlockingIOError:
+            _LOGGER.debug("pty buffer full, dropping %d bytes", len(data))
+
+    os.set_blocking(master, False)
+    session = Session(simulator, write)
+    session.start()
+
+    def readable() -> None:
+        try:
+            data = os.read(master, 1024)
+        except (BlockingIOError, OSError):
+            return
+        asyncio.ensure_future(session.receive(data))
+
+    asyncio.get_running_loop().add_reader(master, readable)
+    return session
+
+
+async def main(args: argparse.Namespace) -> None:
+    simulator = Simulator(args)
+
+    if args.tcp:
+        host, _, port = args.tcp.rpartition(":")
+        await serve_tcp(simulator, host or "127.0.0.1", int(port))
+    if args.pty:
+        serve_pty(simulator)
+
+    await asyncio.Event().wait()
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tcp", metavar="HOST:PORT", help="serve over TCP")
+    parser.add_argument("--pty", action="store_true", help="serve over a pseudo terminal")
+    parser.add_argument("--meters", type=int, default=1, help="number of meters")
+    parser.add_argument("--demand-interval", type=float, default=8,
+                        help="seconds between InstantaneousDemand notifications")
+    parser.add_argument("--summation-interval", type=float, default=60,
+                        help="seconds between CurrentSummationDelivered notifications")
+    parser.add_argument("--price-interval", type=float, default=0,
+                        help="seconds between PriceCluster notifications, 0 to disable")
+    parser.add_argument("--fast-poll-interval", type=float, default=0,
+                        help="override the demand interval requested by set_fast_poll")
+    parser.add_argument("--response-delay", type=float, default=0.05,
+                        help="seconds before a command is answered")
+    parser.add_argument("--garbage-rate", type=float, default=0,
+                        help="probability of a malformed frame before each frame")
+    parser.add_argument("--split", type=int, default=0, metavar="BYTES",
+                        help="write frames in random pieces of up to BYTES")
+    parser.add_argument("--seed", type=int, help="random seed")
+    parser.add_argument("-v", "--verbose", action="store_true")
+
+    args = parser.parse_args(argv)
+    if not args.tcp and not args.pty:
+        parser.error("at least one of --tcp or --pty is required")
+    return args
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    logging.basicConfig(level=logging.DEBUG if arguments.verbose else logging.INFO)
+    if arguments.seed is not None:
+        random.seed(arguments.seed)
+    try:
+        asyncio.run(main(arguments))
+    except KeyboardInterrupt:
+        pass